@@ -0,0 +1,232 @@
+import argparse
+import http.client
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIRECTORY = tempfile.mkdtemp(prefix='mobiledeck-bench-')
+os.environ['MOBILEDECK_DATA_DIR'] = DATA_DIRECTORY
+os.environ['MOBILEDECK_KEY_BACKEND'] = 'record'
+sys.path.insert(0, ROOT)
+
+import mobiledeck
+
+ROUTES = ('index', 'trigger', 'set_group', 'get_button_state', 'set_button_state')
+EXPECTED_STATUSES = {
+    'index': {200},
+    'trigger': {202},
+    'set_group': {302},
+    'get_button_state': {200},
+    'set_button_state': {200}
+}
+QUEUE_FULL_STATUS = 429
+TRANSPORTS = ('client', 'socket')
+
+def build_config(groups, buttons_per_group):
+    profile = {"name": "Bench", "groups": []}
+    for g in range(groups):
+        buttons = []
+        for b in range(buttons_per_group):
+            buttons.append({
+                "id": f"g{g}b{b}",
+                "text": f"Button {b}",
+                "color": "#3498db",
+                "text_color": "#ffffff",
+                "image": None,
+                "hotkey": ["ctrl", "a"],
+                "is_toggle": b % 4 == 3
+            })
+        profile["groups"].append({"name": f"Group {g}", "buttons": buttons})
+    return mobiledeck.validate_config({
+        "profiles": [profile],
+        "active_profile": "Bench",
+        "active_group": "Group 0"
+    })
+
+def make_request(route, i, groups, buttons_per_group):
+    button = i % buttons_per_group
+    if route == 'index':
+        return 'GET', '/', None
+    if route == 'trigger':
+        if button % 4 == 3:
+            button -= 1
+        return 'POST', '/trigger', {"id": f"g0b{max(button, 0)}"}
+    if route == 'set_group':
+        return 'GET', f"/set_group/{quote(f'Group {i % groups}')}", None
+    if route == 'get_button_state':
+        return 'GET', f"/get_button_state/g0b{button}", None
+    return 'POST', '/set_button_state', {"id": f"g0b{button}", "state": i % 2 == 0}
+
+class ClientTransport:
+    def __init__(self):
+        self.client = mobiledeck.app.test_client()
+        self.client.get('/')
+
+    def request(self, method, path, body):
+        response = self.client.open(path, method=method, json=body)
+        return response.status_code
+
+class SocketTransport:
+    def __init__(self, port):
+        self.port = port
+        self.cookie = None
+        self.request('GET', '/', None)
+
+    def request(self, method, path, body):
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        try:
+            connection.request(method, path, payload, headers)
+            response = connection.getresponse()
+            response.read()
+            cookie = response.getheader('Set-Cookie')
+            if cookie:
+                self.cookie = cookie.split(';', 1)[0]
+            return response.status
+        finally:
+            connection.close()
+
+def run_route(route, transports, requests, warmup, groups, buttons_per_group):
+    latencies = [[] for _ in transports]
+    errors = [0] * len(transports)
+    rejected = [0] * len(transports)
+    unexpected = set()
+    spans = [None] * len(transports)
+    per_worker = max(1, requests // len(transports))
+    def work(index):
+        transport = transports[index]
+        for i in range(warmup):
+            transport.request(*make_request(route, i, groups, buttons_per_group))
+        barrier.wait()
+        worker_started = time.perf_counter()
+        for i in range(per_worker):
+            method, path, body = make_request(route, index * per_worker + i, groups, buttons_per_group)
+            started = time.perf_counter()
+            status = transport.request(method, path, body)
+            latencies[index].append(time.perf_counter() - started)
+            if route == 'trigger' and status == QUEUE_FULL_STATUS:
+                rejected[index] += 1
+            elif status not in EXPECTED_STATUSES[route]:
+                errors[index] += 1
+                unexpected.add(status)
+        spans[index] = (worker_started, time.perf_counter())
+    barrier = threading.Barrier(len(transports) + 1)
+    with ThreadPoolExecutor(max_workers=len(transports)) as executor:
+        futures = [executor.submit(work, index) for index in range(len(transports))]
+        barrier.wait()
+        for future in futures:
+            future.result()
+    elapsed = max(end for _, end in spans) - min(start for start, _ in spans)
+    samples = sorted(latency for worker in latencies for latency in worker)
+    return {
+        "requests": len(samples),
+        "errors": sum(errors),
+        "rejected": sum(rejected),
+        "unexpected_statuses": sorted(unexpected),
+        "seconds": round(elapsed, 4),
+        "rps": round(len(samples) / elapsed, 1),
+        "p50_ms": round(mobiledeck.percentile(samples, 0.5) * 1000, 3),
+        "p99_ms": round(mobiledeck.percentile(samples, 0.99) * 1000, 3)
+    }
+
+def check_recorded_keys(keyboard):
+    events = list(keyboard.events) if keyboard is not None else []
+    if not events:
+        return ["no key presses were recorded"]
+    failures = []
+    if ('press', mobiledeck.Key.ctrl) not in events:
+        failures.append("ctrl was not resolved to a special key")
+    pressed = {}
+    for action, key in events:
+        pressed[key] = pressed.get(key, 0) + (1 if action == 'press' else -1)
+    if any(abs(count) > 1 for count in pressed.values()):
+        failures.append(f"presses and releases do not match: {pressed}")
+    return failures
+
+def parse_sizes(text):
+    sizes = []
+    for item in text.split(','):
+        groups, buttons = item.lower().split('x')
+        sizes.append((int(groups), int(buttons)))
+    return sizes
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MobileDeck routes with a recording key backend")
+    parser.add_argument('--sizes', default='1x12,10x100,50x500', help="comma separated GROUPSxBUTTONS synthetic config sizes")
+    parser.add_argument('--routes', default=','.join(ROUTES), help="comma separated routes to benchmark")
+    parser.add_argument('--transports', default=','.join(TRANSPORTS), help="client (Flask test client) and/or socket (real local HTTP server)")
+    parser.add_argument('--requests', type=int, default=500, help="timed requests per route, size and transport")
+    parser.add_argument('--warmup', type=int, default=20, help="untimed requests each worker sends first")
+    parser.add_argument('--concurrency', type=int, default=8, help="concurrent workers")
+    parser.add_argument('--threads', type=int, default=8, help="worker threads of the socket server")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args()
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    routes = [route for route in args.routes.split(',') if route]
+    transports = [transport for transport in args.transports.split(',') if transport]
+    for name in routes:
+        if name not in ROUTES:
+            parser.error(f"unknown route '{name}'")
+    for name in transports:
+        if name not in TRANSPORTS:
+            parser.error(f"unknown transport '{name}'")
+    server = None
+    if 'socket' in transports:
+        server = mobiledeck.PooledWSGIServer('127.0.0.1', 0, mobiledeck.app, args.threads, 30.0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    results = []
+    failures = []
+    print(f"{'size':>10} {'transport':>9} {'route':>17} {'requests':>8} {'errors':>6} {'queue full':>10} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    try:
+        for groups, buttons_per_group in parse_sizes(args.sizes):
+            mobiledeck.config = build_config(groups, buttons_per_group)
+            mobiledeck.invalidate_page_cache()
+            for transport_name in transports:
+                if transport_name == 'client':
+                    workers = [ClientTransport() for _ in range(args.concurrency)]
+                else:
+                    workers = [SocketTransport(server.server_port) for _ in range(args.concurrency)]
+                for route in routes:
+                    result = run_route(route, workers, args.requests, args.warmup, groups, buttons_per_group)
+                    result.update({"size": f"{groups}x{buttons_per_group}", "transport": transport_name, "route": route})
+                    results.append(result)
+                    print(f"{result['size']:>10} {transport_name:>9} {route:>17} {result['requests']:>8} {result['errors']:>6} {result['rejected']:>10} {result['rps']:>9} {result['p50_ms']:>8} {result['p99_ms']:>8}")
+                    if result['errors']:
+                        failures.append(f"{result['size']} {transport_name} {route}: {result['errors']} responses with unexpected status {result['unexpected_statuses']}")
+        mobiledeck.injector.queue.join()
+        stats = mobiledeck.injector.stats()
+        print(f"Key jobs: {stats['completed']} completed, {stats['failed']} failed, {stats['rejected']} rejected")
+        if stats['failed']:
+            failures.append(f"{stats['failed']} key jobs failed")
+        if 'trigger' in routes:
+            failures.extend(check_recorded_keys(mobiledeck.keyboard))
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        mobiledeck.clients.store.flush()
+        shutil.rmtree(DATA_DIRECTORY, ignore_errors=True)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+    if failures:
+        for failure in failures:
+            print(f"FAILED: {failure}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
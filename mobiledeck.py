@@ -1,162 +1,990 @@
-from flask import Flask, render_template_string, request, redirect, url_for, session, jsonify, send_from_directory
-from pynput.keyboard import Controller, Key
+from flask import Flask, render_template, request, redirect, url_for, jsonify, send_from_directory, g
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
 import json
 import os
 import base64
-import tkinter as tk
-from tkinter import ttk, colorchooser, filedialog, messagebox
 import importlib.util
 import sys
 from datetime import datetime
 import threading
 import webbrowser
 import socket
+import socketserver
+import hashlib
+import struct
+from urllib.parse import urlsplit, unquote_to_bytes
+import urllib.request
 import re
+import uuid
+import tempfile
+import atexit
+import queue
+import itertools
+import bisect
+import enum
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import gzip
+import io
+import math
+import signal
+import subprocess
+import copy
+import secrets
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+startup_started = time.perf_counter()
+startup_phases = []
+
+def mark_startup(phase):
+    startup_phases.append((phase, time.perf_counter()))
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
-keyboard = Controller()
-button_states = {}
+keyboard = None
+Key = None
+key_backend_lock = threading.Lock()
+KEY_BACKENDS = ('pynput', 'record', 'null')
+key_backend_name = os.environ.get('MOBILEDECK_KEY_BACKEND', 'pynput')
+tk = ttk = colorchooser = filedialog = messagebox = simpledialog = None
+gui_lock = threading.Lock()
+Image = ImageOps = features = None
+imaging_checked = False
+imaging_lock = threading.Lock()
+page_cache = {}
+PAGE_CACHE_SIZE = 64
+STATE_VERSION_MARKER = '__STATE_VERSION__'
 
 def get_script_directory():
     if getattr(sys, 'frozen', False):
         return os.path.dirname(sys.executable)
     return os.path.dirname(os.path.abspath(__file__))
 
-def load_config():
-    script_dir = get_script_directory()
-    config_path = os.path.join(script_dir, 'config.py')
-    if os.path.exists(config_path):
-        spec = importlib.util.spec_from_file_location("config", config_path)
-        config = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(config)
-        if not hasattr(config, 'profiles'):
-            config.profiles = [
-                {
-                    "name": "Default",
-                    "groups": [
-                        {
-                            "name": "Main",
-                            "buttons": getattr(config, 'buttons', [])
-                        }
-                    ]
-                }
-            ]
-        if not hasattr(config, 'default_preferences'):
-            config.default_preferences = {
-                "theme": "dark",
-                "buttons_per_row": 3, 
-                "button_height": 100,
-                "button_width": 120
+def invalidate_page_cache():
+    page_cache.clear()
+
+def new_button_id():
+    return uuid.uuid4().hex[:12]
+
+SPECIAL_KEYS = (
+    'alt', 'alt_l', 'alt_r', 'alt_gr', 'backspace', 'caps_lock', 'cmd', 'cmd_l', 'cmd_r',
+    'ctrl', 'ctrl_l', 'ctrl_r', 'delete', 'down', 'end', 'enter', 'esc', 'home', 'insert',
+    'left', 'menu', 'num_lock', 'page_down', 'page_up', 'pause', 'print_screen', 'right',
+    'scroll_lock', 'shift', 'shift_l', 'shift_r', 'space', 'tab', 'up',
+    'media_play_pause', 'media_volume_mute', 'media_volume_down', 'media_volume_up',
+    'media_previous', 'media_next'
+) + tuple(f'f{i}' for i in range(1, 21))
+RecordedKey = enum.Enum('RecordedKey', SPECIAL_KEYS)
+
+class RecordingKeyboard:
+    def __init__(self, limit=10000):
+        self.events = deque(maxlen=limit)
+
+    def press(self, key):
+        self.events.append(('press', key))
+
+    def release(self, key):
+        self.events.append(('release', key))
+
+    def type(self, text):
+        self.events.append(('type', text))
+
+def set_key_backend(name):
+    global key_backend_name, keyboard, Key
+    if name not in KEY_BACKENDS:
+        raise ValueError(f"unknown key backend '{name}'")
+    with key_backend_lock:
+        key_backend_name = name
+        keyboard = None
+        Key = None
+
+def load_key_backend():
+    global keyboard, Key
+    with key_backend_lock:
+        if keyboard is None:
+            if key_backend_name == 'record':
+                Key = RecordedKey
+                keyboard = RecordingKeyboard()
+            elif key_backend_name == 'null':
+                Key = RecordedKey
+                keyboard = RecordingKeyboard(limit=0)
+            else:
+                from pynput.keyboard import Controller, Key as PynputKey
+                Key = PynputKey
+                keyboard = Controller()
+    return keyboard
+
+def load_gui():
+    global tk, ttk, colorchooser, filedialog, messagebox, simpledialog
+    with gui_lock:
+        if tk is None:
+            import tkinter
+            from tkinter import ttk as tkinter_ttk, colorchooser as tkinter_colorchooser, filedialog as tkinter_filedialog, messagebox as tkinter_messagebox, simpledialog as tkinter_simpledialog
+            ttk = tkinter_ttk
+            colorchooser = tkinter_colorchooser
+            filedialog = tkinter_filedialog
+            messagebox = tkinter_messagebox
+            simpledialog = tkinter_simpledialog
+            tk = tkinter
+
+def load_imaging():
+    global Image, ImageOps, features, imaging_checked
+    with imaging_lock:
+        if not imaging_checked:
+            imaging_checked = True
+            try:
+                from PIL import Image as pil_image, ImageOps as pil_imageops, features as pil_features
+            except ImportError:
+                return False
+            ImageOps = pil_imageops
+            features = pil_features
+            Image = pil_image
+    return Image is not None
+
+def resolve_key(key):
+    load_key_backend()
+    return getattr(Key, key) if hasattr(Key, key) else key
+
+MAX_STEP_SECONDS = 60.0
+MAX_STEP_REPEAT = 100
+
+def compile_step(step):
+    if isinstance(step, list):
+        step = {"keys": step}
+    keys = tuple(resolve_key(key) for key in step.get("keys") or [])
+    return (
+        keys,
+        step.get("text") or "",
+        float(step.get("hold", 0)),
+        int(step.get("repeat", 1)),
+        float(step.get("delay", 0))
+    )
+
+def compile_key_plan(button):
+    steps = [button.get("hotkey") or []] + list(button.get("sequence") or [])
+    return tuple(compile_step(step) for step in steps if step)
+
+def is_key_list(keys):
+    return isinstance(keys, list) and all(isinstance(key, str) and key for key in keys)
+
+def validate_step(step, button_text):
+    if isinstance(step, list):
+        if not is_key_list(step):
+            raise ValueError(f"button '{button_text}' has an invalid sequence step")
+        return
+    if not isinstance(step, dict) or not set(step) <= {"keys", "text", "hold", "repeat", "delay"}:
+        raise ValueError(f"button '{button_text}' has an invalid sequence step")
+    if not is_key_list(step.get("keys", [])) or not isinstance(step.get("text", ""), str):
+        raise ValueError(f"button '{button_text}' has an invalid sequence step")
+    for name in ("hold", "delay"):
+        value = step.get(name, 0)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= MAX_STEP_SECONDS:
+            raise ValueError(f"button '{button_text}' has a {name} outside 0-{MAX_STEP_SECONDS:g} seconds")
+    repeat = step.get("repeat", 1)
+    if isinstance(repeat, bool) or not isinstance(repeat, int) or not 1 <= repeat <= MAX_STEP_REPEAT:
+        raise ValueError(f"button '{button_text}' has a repeat outside 1-{MAX_STEP_REPEAT}")
+
+class DeckConfig:
+    def __init__(self, profiles, default_preferences, active_profile="Default", active_group="Main"):
+        self.profiles = profiles
+        self.default_preferences = default_preferences
+        self.active_profile = active_profile
+        self.active_group = active_group
+        self.reindex()
+        self.version = self.content_hash()
+
+    def content_hash(self):
+        text = json.dumps([self.profiles, self.default_preferences], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+    def reindex(self):
+        self.profiles_by_name = {}
+        self.profile_positions = {}
+        self.groups_by_name = {}
+        self.group_positions = {}
+        self.buttons_by_id = {}
+        self.key_plans = {}
+        for i, profile in enumerate(self.profiles):
+            if profile["name"] in self.profiles_by_name:
+                continue
+            self.profiles_by_name[profile["name"]] = profile
+            self.profile_positions[profile["name"]] = i
+            for j, group in enumerate(profile["groups"]):
+                group_key = (profile["name"], group["name"])
+                if group_key in self.groups_by_name:
+                    continue
+                self.groups_by_name[group_key] = group
+                self.group_positions[group_key] = j
+                for button in group["buttons"]:
+                    if not button.get("id") or button["id"] in self.buttons_by_id:
+                        button["id"] = new_button_id()
+                    self.buttons_by_id[button["id"]] = button
+
+    def get_profile(self, profile_name):
+        return self.profiles_by_name.get(profile_name)
+
+    def get_group(self, profile_name, group_name):
+        return self.groups_by_name.get((profile_name, group_name))
+
+    def get_button(self, button_id):
+        return self.buttons_by_id.get(button_id)
+
+    def compile_key_plans(self):
+        for button_id, button in list(self.buttons_by_id.items()):
+            if button_id not in self.key_plans:
+                self.key_plans[button_id] = compile_key_plan(button)
+
+    def get_key_plan(self, button_id):
+        plan = self.key_plans.get(button_id)
+        if plan is None:
+            button = self.buttons_by_id.get(button_id)
+            if button is None:
+                return None
+            plan = compile_key_plan(button)
+            self.key_plans[button_id] = plan
+        return plan
+
+    def get_active_profile(self):
+        return self.get_profile(self.active_profile)
+
+    def get_active_group(self):
+        return self.get_group(self.active_profile, self.active_group)
+
+    def profile_position(self, profile_name):
+        return self.profile_positions.get(profile_name)
+
+    def group_position(self, profile_name, group_name):
+        return self.group_positions.get((profile_name, group_name))
+
+    def to_dict(self):
+        return {
+            "profiles": self.profiles,
+            "default_preferences": self.default_preferences,
+            "active_profile": self.active_profile,
+            "active_group": self.active_group
+        }
+
+DEFAULT_PREFERENCES = {
+    "theme": "dark",
+    "buttons_per_row": 3,
+    "button_height": 100,
+    "button_width": 120,
+    "image_atlas": False
+}
+CONFIG_FILE = 'config.json'
+LEGACY_CONFIG_FILE = 'config.py'
+saved_config_text = None
+
+def get_data_directory():
+    return os.environ.get('MOBILEDECK_DATA_DIR') or get_script_directory()
+
+def get_config_path(filename=CONFIG_FILE):
+    return os.path.join(get_data_directory(), filename)
+
+def write_file_atomic(path, text):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+BUTTON_FIELD_TYPES = {
+    "id": str,
+    "color": str,
+    "text_color": str,
+    "image": (str, type(None)),
+    "hotkey": list,
+    "sequence": list,
+    "is_toggle": bool
+}
+
+def is_name(value):
+    return isinstance(value, str) and bool(value)
+
+def validate_button(button):
+    if not isinstance(button, dict):
+        raise ValueError("every button must be an object")
+    if not isinstance(button.get("text", ""), str):
+        raise ValueError("button text must be a string")
+    button_text = button.get("text", "")
+    for name, kind in BUTTON_FIELD_TYPES.items():
+        if name in button and not isinstance(button[name], kind):
+            raise ValueError(f"button '{button_text}' has an invalid {name}")
+    if not is_key_list(button.get("hotkey", [])):
+        raise ValueError(f"button '{button_text}' has an invalid hotkey")
+    for step in button.get("sequence", []):
+        validate_step(step, button_text)
+    button.setdefault("text", "")
+    button.setdefault("color", "#3498db")
+    button.setdefault("text_color", "#ffffff")
+    button.setdefault("image", None)
+    button.setdefault("hotkey", [])
+    button.setdefault("is_toggle", False)
+
+def validate_config(data):
+    if not isinstance(data, dict):
+        raise ValueError("configuration must be a JSON object")
+    profiles = data.get("profiles", [])
+    if not isinstance(profiles, list):
+        raise ValueError("profiles must be a list")
+    if not profiles:
+        profiles = [
+            {
+                "name": "Default",
+                "groups": [
+                    {
+                        "name": "Main",
+                        "buttons": []
+                    }
+                ]
             }
-        return config
-    else:
-        class DefaultConfig:
-            def __init__(self):
-                self.profiles = [
+        ]
+    for profile in profiles:
+        if not isinstance(profile, dict) or not is_name(profile.get("name")):
+            raise ValueError("every profile needs a name")
+        groups = profile.setdefault("groups", [])
+        if not isinstance(groups, list):
+            raise ValueError(f"groups of profile '{profile['name']}' must be a list")
+        if not groups:
+            groups.append({"name": "Main", "buttons": []})
+        for group in groups:
+            if not isinstance(group, dict) or not is_name(group.get("name")):
+                raise ValueError(f"every group in profile '{profile['name']}' needs a name")
+            buttons = group.setdefault("buttons", [])
+            if not isinstance(buttons, list):
+                raise ValueError(f"buttons of group '{group['name']}' must be a list")
+            for button in buttons:
+                validate_button(button)
+    preferences = data.get("default_preferences") or {}
+    if not isinstance(preferences, dict):
+        raise ValueError("default_preferences must be an object")
+    for name, value in preferences.items():
+        if name in DEFAULT_PREFERENCES and type(value) is not type(DEFAULT_PREFERENCES[name]):
+            raise ValueError(f"default preference '{name}' has an invalid value")
+    default_preferences = dict(DEFAULT_PREFERENCES)
+    default_preferences.update(preferences)
+    active_profile = data.get("active_profile", "Default")
+    active_group = data.get("active_group", "Main")
+    if not isinstance(active_profile, str) or not isinstance(active_group, str):
+        raise ValueError("active_profile and active_group must be strings")
+    return DeckConfig(profiles, default_preferences, active_profile, active_group)
+
+def load_legacy_config(legacy_path):
+    spec = importlib.util.spec_from_file_location("config", legacy_path)
+    legacy = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(legacy)
+    profiles = getattr(legacy, 'profiles', None)
+    if profiles is None:
+        profiles = [
+            {
+                "name": "Default",
+                "groups": [
                     {
-                        "name": "Default",
-                        "groups": [
-                            {
-                                "name": "Main",
-                                "buttons": []
-                            }
-                        ]
+                        "name": "Main",
+                        "buttons": getattr(legacy, 'buttons', [])
                     }
                 ]
-                self.default_preferences = {
-                    "theme": "dark",
-                    "buttons_per_row": 3,
-                    "button_height": 100,
-                    "button_width": 120
-                }
-                self.active_profile = "Default"
-                self.active_group = "Main"
-        return DefaultConfig()
+            }
+        ]
+    return {
+        "profiles": profiles,
+        "default_preferences": getattr(legacy, 'default_preferences', {}),
+        "active_profile": getattr(legacy, 'active_profile', 'Default'),
+        "active_group": getattr(legacy, 'active_group', 'Main')
+    }
+
+def migrate_legacy_config(legacy_path, config_path):
+    config = validate_config(load_legacy_config(legacy_path))
+    save_config(config.to_dict())
+    os.replace(legacy_path, legacy_path + '.bak')
+    print(f"Migrated {legacy_path} to {config_path}")
+    return config
+
+def read_config():
+    global saved_config_text
+    config_path = get_config_path()
+    if not os.path.exists(config_path):
+        legacy_path = get_config_path(LEGACY_CONFIG_FILE)
+        if os.path.exists(legacy_path):
+            return migrate_legacy_config(legacy_path, config_path)
+        return validate_config({})
+    with open(config_path, encoding='utf-8') as f:
+        text = f.read()
+    config = validate_config(json.loads(text))
+    saved_config_text = text
+    return config
 
 def save_config(config_data):
-    script_dir = get_script_directory()
-    config_path = os.path.join(script_dir, 'config.py')
-    with open(config_path, 'w') as f:
-        f.write("profiles = [\n")
-        for profile in config_data["profiles"]:
-            f.write("    {\n")
-            f.write(f"        \"name\": \"{profile['name']}\",\n")
-            f.write("        \"groups\": [\n")
-            for group in profile["groups"]:
-                f.write("            {\n")
-                f.write(f"                \"name\": \"{group['name']}\",\n")
-                f.write("                \"buttons\": [\n")
-                for button in group["buttons"]:
-                    f.write("                    {\n")
-                    f.write(f"                        \"text\": \"{button['text']}\",\n")
-                    f.write(f"                        \"color\": \"{button['color']}\",\n")
-                    f.write(f"                        \"text_color\": \"{button['text_color']}\",\n")
-                    if button['image']:
-                        f.write(f"                        \"image\": \"{button['image']}\",\n")
-                    else:
-                        f.write("                        \"image\": None,\n")
-                    f.write("                        \"hotkey\": [")
-                    for i, key in enumerate(button["hotkey"]):
-                        if i > 0:
-                            f.write(", ")
-                        f.write(f"\"{key}\"")
-                    f.write("],\n")
-                    if "sequence" in button and button["sequence"]:
-                        f.write("                        \"sequence\": [\n")
-                        for seq in button["sequence"]:
-                            f.write("                            [")
-                            for i, key in enumerate(seq):
-                                if i > 0:
-                                    f.write(", ")
-                                f.write(f"\"{key}\"")
-                            f.write("],\n")
-                        f.write("                        ],\n")
-                    f.write(f"                        \"is_toggle\": {str(button['is_toggle'])}\n")
-                    f.write("                    },\n")
-                f.write("                ]\n")
-                f.write("            },\n")
-            f.write("        ]\n")
-            f.write("    },\n")
-        f.write("]\n\n")
-        f.write(f"active_profile = \"{config_data.get('active_profile', 'Default')}\"\n")
-        f.write(f"active_group = \"{config_data.get('active_group', 'Main')}\"\n\n")
-        f.write("default_preferences = {\n")
-        for key, value in config_data["default_preferences"].items():
-            if isinstance(value, str):
-                f.write(f"    \"{key}\": \"{value}\",\n")
-            else:
-                f.write(f"    \"{key}\": {value},\n")
-        f.write("}\n")
+    global saved_config_text
+    invalidate_page_cache()
+    text = json.dumps({
+        "profiles": config_data["profiles"],
+        "active_profile": config_data.get("active_profile", "Default"),
+        "active_group": config_data.get("active_group", "Main"),
+        "default_preferences": config_data["default_preferences"]
+    }, indent=4, ensure_ascii=False)
+    if text == saved_config_text:
+        return
+    write_file_atomic(get_config_path(), text)
+    saved_config_text = text
 
-config = load_config()
+class StateFile:
+    def __init__(self, filename, delay=1.0):
+        self.path = get_config_path(filename)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.timer = None
+        self.dirty = False
+        self.data = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            pass
 
-def get_active_buttons():
-    active_profile = getattr(config, 'active_profile', 'Default')
-    active_group = getattr(config, 'active_group', 'Main')
-    for profile in config.profiles:
-        if profile['name'] == active_profile:
-            for group in profile['groups']:
-                if group['name'] == active_group:
-                    return group['buttons']
-    return []
+    def get(self, key, default=None):
+        return self.data.get(key, default)
 
-class ButtonManager:
-    def __init__(self, root=None):
-        self.config_data = {
-            "profiles": config.profiles,
-            "default_preferences": config.default_preferences,
-            "active_profile": getattr(config, 'active_profile', 'Default'),
-            "active_group": getattr(config, 'active_group', 'Main')
+    def update(self, **values):
+        with self.lock:
+            self.data.update(values)
+            self.dirty = True
+            if self.timer is None:
+                self.timer = threading.Timer(self.delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.dirty:
+                return
+            text = json.dumps(self.data, indent=4, ensure_ascii=False)
+            self.dirty = False
+        try:
+            write_file_atomic(self.path, text)
+        except OSError as e:
+            print(f"Error while saving {self.path}: {e}")
+
+DEVICE_COOKIE = 'mobiledeck_device'
+DEVICE_COOKIE_MAX_AGE = 10 * 365 * 24 * 3600
+DEFAULT_CLIENT_SETTINGS = {
+    "theme": "dark",
+    "buttons_per_row": 3,
+    "button_height": 100,
+    "button_width": 120,
+    "latency_overlay": False
+}
+CLIENT_SETTING_LIMITS = {
+    "buttons_per_row": (1, 6),
+    "button_height": (50, 300),
+    "button_width": (50, 400)
+}
+
+def clamp_setting(name, value):
+    low, high = CLIENT_SETTING_LIMITS[name]
+    return min(max(value, low), high)
+
+class ClientRegistry:
+    def __init__(self, filename, max_clients=256):
+        self.store = StateFile(filename)
+        self.max_clients = max_clients
+        self.lock = threading.Lock()
+
+    def get(self, token):
+        record = self.store.get(token) if token else None
+        return dict(DEFAULT_CLIENT_SETTINGS, **(record or {}))
+
+    def update(self, token, **values):
+        with self.lock:
+            record = dict(self.store.get(token) or {}, **values)
+            record["last_seen"] = time.time()
+            self.store.update(**{token: record})
+            if len(self.store.data) > self.max_clients:
+                self.prune()
+        return dict(DEFAULT_CLIENT_SETTINGS, **record)
+
+    def prune(self):
+        with self.store.lock:
+            oldest = sorted(self.store.data, key=lambda token: self.store.data[token].get("last_seen", 0))
+            for token in oldest[:len(oldest) - self.max_clients]:
+                del self.store.data[token]
+
+clients = ClientRegistry('clients.json')
+atexit.register(clients.store.flush)
+
+def device_token():
+    token = request.cookies.get(DEVICE_COOKIE)
+    if not token or len(token) > 64:
+        token = g.get('new_device_token')
+        if token is None:
+            token = g.new_device_token = secrets.token_urlsafe(16)
+    return token
+
+def current_client():
+    return clients.get(device_token())
+
+def client_selection(client):
+    profile_name = client.get('active_profile')
+    group_name = client.get('active_group')
+    if config.get_group(profile_name, group_name) is None:
+        return config.active_profile, config.active_group
+    return profile_name, group_name
+
+try:
+    config = read_config()
+except (OSError, ValueError) as e:
+    print(f"Error while loading {get_config_path()}: {e}")
+    print("Fix or move the file and start MobileDeck again; it was left untouched so your buttons are not lost")
+    sys.exit(1)
+mark_startup('config')
+
+config_lock = threading.Lock()
+config_listeners = []
+
+def on_config_change(listener):
+    config_listeners.append(listener)
+    return listener
+
+def notify_config_change():
+    for listener in list(config_listeners):
+        try:
+            listener(config)
+        except Exception as e:
+            print(f"Error while notifying a config listener: {e}")
+
+def swap_config(new_config):
+    global config
+    new_config.compile_key_plans()
+    config = new_config
+    invalidate_page_cache()
+    image_cache.ingest_config(config)
+    notify_config_change()
+
+class ConfigWatcher:
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+        self.signature = self.stat()
+
+    def stat(self):
+        try:
+            result = os.stat(get_config_path())
+        except OSError:
+            return None
+        return (result.st_mtime_ns, result.st_size)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            signature = self.stat()
+            if signature is None or signature == self.signature:
+                continue
+            self.signature = signature
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Error while reloading {get_config_path()}: {e}")
+
+    def check(self):
+        global saved_config_text
+        config_path = get_config_path()
+        try:
+            with open(config_path, encoding='utf-8') as f:
+                text = f.read()
+            if text == saved_config_text:
+                return
+            new_config = validate_config(json.loads(text))
+        except (OSError, ValueError) as e:
+            print(f"Ignoring change to {config_path}, keeping the current buttons: {e}")
+            return
+        with config_lock:
+            saved_config_text = text
+            swap_config(new_config)
+        print(f"Reloaded {config_path}")
+
+config_watcher = ConfigWatcher()
+
+LATENCY_BUCKETS = tuple(1e-6 * 2 ** (i / 2) for i in range(53))
+METRIC_STAGES = ('parse', 'resolve', 'press', 'release', 'queue_wait', 'run', 'total')
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum, self.count
+
+class Metrics:
+    def __init__(self, stages=METRIC_STAGES):
+        self.histograms = {stage: LatencyHistogram() for stage in stages}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(stage, LatencyHistogram())
+        histogram.observe(seconds)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def render(self, gauges=()):
+        lines = [
+            "# HELP mobiledeck_stage_seconds Time spent in each stage between a tap and the injected keys.",
+            "# TYPE mobiledeck_stage_seconds histogram"
+        ]
+        for stage, histogram in sorted(self.histograms.items()):
+            counts, total, count = histogram.snapshot()
+            cumulative = 0
+            for bound, bucket in zip(LATENCY_BUCKETS, counts):
+                cumulative += bucket
+                lines.append(f'mobiledeck_stage_seconds_bucket{{stage="{stage}",le="{bound:.6g}"}} {cumulative}')
+            lines.append(f'mobiledeck_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {count}')
+            lines.append(f'mobiledeck_stage_seconds_sum{{stage="{stage}"}} {total:.9f}')
+            lines.append(f'mobiledeck_stage_seconds_count{{stage="{stage}"}} {count}')
+        with self.lock:
+            counters = sorted(self.counters.items())
+        declared = set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                lines.append(f"# TYPE mobiledeck_{name}_total counter")
+                declared.add(name)
+            label_text = ",".join(f'{label}="{label_value}"' for label, label_value in labels)
+            lines.append(f"mobiledeck_{name}_total{{{label_text}}} {value}")
+        for name, help_text, value in gauges:
+            lines.append(f"# HELP mobiledeck_{name} {help_text}")
+            lines.append(f"# TYPE mobiledeck_{name} gauge")
+            lines.append(f"mobiledeck_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def press_chord(keys, hold=0, cancel=None):
+    keyboard = load_key_backend()
+    pressed = []
+    try:
+        for key in keys:
+            started = time.perf_counter()
+            keyboard.press(key)
+            metrics.observe('press', time.perf_counter() - started)
+            pressed.append(key)
+        if hold > 0:
+            wait_until(time.monotonic() + hold, cancel)
+    finally:
+        for key in reversed(pressed):
+            started = time.perf_counter()
+            keyboard.release(key)
+            metrics.observe('release', time.perf_counter() - started)
+
+def wait_until(deadline, cancel=None):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return not (cancel and cancel.is_set())
+    if cancel is None:
+        time.sleep(remaining)
+        return True
+    return not cancel.wait(remaining)
+
+def run_plan(plan, cancel):
+    for keys, text, hold, repeat, delay in plan:
+        for _ in range(repeat):
+            if cancel.is_set():
+                return False
+            if keys:
+                press_chord(keys, hold, cancel)
+            if text and not cancel.is_set():
+                load_key_backend().type(text)
+            if delay > 0 and not wait_until(time.monotonic() + delay, cancel):
+                return False
+    return not cancel.is_set()
+
+class KeyInjector:
+    def __init__(self, max_queue=64, history=256):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.history = history
+        self.job_ids = itertools.count(1)
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.cancelled = 0
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def submit(self, plan, received_at=None):
+        self.start()
+        queued_at = time.perf_counter()
+        job = {
+            "id": next(self.job_ids),
+            "status": "queued",
+            "received_at": received_at or queued_at,
+            "queued_at": queued_at,
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "cancel": threading.Event()
         }
-        if root is None:
-            self.root = tk.Tk()
-            self.root.title("MobileDeck Button Manager")
-            self.root.geometry("1000x700")
-            self.root.minsize(800, 600)
-            self.setup_ui()
-        else:
-            self.root = root
+        try:
+            self.queue.put_nowait((job, plan))
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            raise
+        with self.lock:
+            self.jobs[job["id"]] = job
+            while len(self.jobs) > self.history:
+                self.jobs.popitem(last=False)
+        return job
+
+    def run(self):
+        try:
+            load_key_backend()
+            config.compile_key_plans()
+        except Exception as e:
+            print(f"Error while loading the key backend: {e}")
+        while True:
+            job, plan = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                break
+            job["started_at"] = time.perf_counter()
+            job["status"] = "running"
+            try:
+                job["status"] = "done" if run_plan(plan, job["cancel"]) else "cancelled"
+            except Exception as e:
+                print(f"Error while processing keys: {e}")
+                job["status"] = "failed"
+                job["error"] = str(e)
+            job["finished_at"] = time.perf_counter()
+            metrics.observe('queue_wait', job["started_at"] - job["queued_at"])
+            metrics.observe('run', job["finished_at"] - job["started_at"])
+            metrics.observe('total', job["finished_at"] - job["received_at"])
+            metrics.increment('jobs', status=job["status"])
+            with self.lock:
+                if job["status"] == "done":
+                    self.completed += 1
+                elif job["status"] == "cancelled":
+                    self.cancelled += 1
+                else:
+                    self.failed += 1
+            self.queue.task_done()
+
+    def stop(self, timeout=5.0):
+        with self.lock:
+            thread = self.thread
+        if thread is None:
+            return
+        try:
+            self.queue.put((None, None), timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+    def describe(self, job):
+        result = {"id": job["id"], "status": job["status"], "error": job["error"]}
+        if job["started_at"] is not None:
+            result["queue_ms"] = round((job["started_at"] - job["queued_at"]) * 1000, 3)
+        if job["finished_at"] is not None:
+            result["run_ms"] = round((job["finished_at"] - job["started_at"]) * 1000, 3)
+            result["total_ms"] = round((job["finished_at"] - job["queued_at"]) * 1000, 3)
+        return result
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        job["cancel"].set()
+        return self.describe(job)
+
+    def get_job(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        return self.describe(job) if job else None
+
+    def stats(self):
+        with self.lock:
+            finished = [job for job in self.jobs.values() if job["finished_at"] is not None]
+            stats = {
+                "depth": self.queue.qsize(),
+                "capacity": self.queue.maxsize,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "cancelled": self.cancelled
+            }
+        latencies = sorted((job["finished_at"] - job["queued_at"]) * 1000 for job in finished)
+        if latencies:
+            stats["latency_ms"] = {
+                "last": round((finished[-1]["finished_at"] - finished[-1]["queued_at"]) * 1000, 3),
+                "p50": round(latencies[len(latencies) // 2], 3),
+                "max": round(latencies[-1], 3)
+            }
+        return stats
+
+injector = KeyInjector()
+
+def trigger_button(button_id, received_at=None):
+    status, job = submit_button(button_id, received_at)
+    metrics.increment('taps', status=status)
+    return status, job
+
+def submit_button(button_id, received_at):
+    button = config.get_button(button_id)
+    if button is None:
+        return 'not_found', None
+    if button.get('is_toggle', False) and not button_states.get(button_id, False):
+        return 'inactive', None
+    started = time.perf_counter()
+    plan = config.get_key_plan(button_id)
+    metrics.observe('resolve', time.perf_counter() - started)
+    try:
+        job = injector.submit(plan, received_at)
+    except queue.Full:
+        return 'busy', None
+    return 'queued', job
+
+class ToggleStateStore:
+    def __init__(self, history=1024):
+        self.states = {}
+        self.version = 0
+        self.changes = deque(maxlen=history)
+        self.lock = threading.Lock()
+
+    def get(self, button_id, default=False):
+        return self.states.get(button_id, default)
+
+    def compare_and_set(self, button_id, state, expected=None):
+        with self.lock:
+            current = self.states.get(button_id, False)
+            if expected is not None and current != expected:
+                return False, self.version
+            if current != state:
+                self.version += 1
+                self.states[button_id] = state
+                self.changes.append((self.version, button_id, state))
+            return True, self.version
+
+    def changes_since(self, version):
+        with self.lock:
+            current = self.version
+            changes = list(self.changes)
+        if version == current:
+            return current, {}
+        if version > current or version < 0 or not changes or changes[0][0] > version + 1:
+            return current, None
+        return current, {button_id: state for change_version, button_id, state in changes if change_version > version}
+
+button_states = ToggleStateStore()
+
+def get_toggle_states(buttons):
+    return {button['id']: button_states.get(button['id'], False) for button in buttons if button.get('is_toggle', False)}
+
+def update_button_state(button_id, state, origin=None, expected=None):
+    changed, version = button_states.compare_and_set(button_id, state, expected)
+    if changed:
+        broadcast({"type": "state", "id": button_id, "state": state, "version": version}, exclude=origin)
+    return changed, version
+
+MAX_PREFIX_LENGTH = 32
+
+class SearchIndex:
+    def __init__(self):
+        self.tokens = {}
+        self.prefixes = {}
+
+    def tokenize(self, text):
+        return {token[:MAX_PREFIX_LENGTH] for token in re.findall(r'\w+', text.lower())}
+
+    def add(self, key, text):
+        self.remove(key)
+        tokens = self.tokenize(text)
+        self.tokens[key] = tokens
+        for token in tokens:
+            for end in range(1, len(token) + 1):
+                self.prefixes.setdefault(token[:end], set()).add(key)
+
+    def remove(self, key):
+        for token in self.tokens.pop(key, ()):
+            for end in range(1, len(token) + 1):
+                keys = self.prefixes.get(token[:end])
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.prefixes[token[:end]]
+
+    def retain(self, keys):
+        for key in [key for key in self.tokens if key not in keys]:
+            self.remove(key)
+
+    def search(self, query):
+        words = self.tokenize(query)
+        if not words:
+            return None
+        matches = None
+        for word in words:
+            keys = self.prefixes.get(word, set())
+            matches = set(keys) if matches is None else matches & keys
+            if not matches:
+                break
+        return matches
+
+class ButtonManager:
+    def __init__(self, snapshot, master):
+        self.model = DeckConfig(
+            snapshot["profiles"],
+            snapshot["default_preferences"],
+            snapshot["active_profile"],
+            snapshot["active_group"]
+        )
+        self.root = tk.Toplevel(master)
+        self.root.title("MobileDeck Button Manager")
+        self.root.geometry("1000x700")
+        self.root.minsize(800, 600)
+        self.setup_ui()
     
     def setup_ui(self):
         self.root.columnconfigure(0, weight=1)
@@ -211,17 +1039,23 @@ class ButtonManager:
         right_panel.rowconfigure(1, weight=0)
         buttons_frame = ttk.LabelFrame(right_panel, text="Buttons")
         buttons_frame.grid(row=0, column=0, sticky="nsew", pady=(0, 10))
-        buttons_frame.columnconfigure(0, weight=1)
-        buttons_frame.rowconfigure(0, weight=1)
+        buttons_frame.columnconfigure(3, weight=1)
+        buttons_frame.rowconfigure(1, weight=1)
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(buttons_frame, textvariable=self.search_var)
+        search_entry.grid(row=0, column=0, sticky="ew", padx=5, pady=5, columnspan=4)
+        self.search_var.trace_add("write", self.on_search)
         self.buttons_listbox = tk.Listbox(buttons_frame, exportselection=0)
-        self.buttons_listbox.grid(row=0, column=0, sticky="nsew", padx=5, pady=5, columnspan=3)
+        self.buttons_listbox.grid(row=1, column=0, sticky="nsew", padx=5, pady=5, columnspan=4)
         self.buttons_listbox.bind('<<ListboxSelect>>', self.on_button_select)
         add_button_btn = ttk.Button(buttons_frame, text="+", width=3, command=self.add_button)
-        add_button_btn.grid(row=1, column=0, sticky="w", padx=5, pady=5)
+        add_button_btn.grid(row=2, column=0, sticky="w", padx=5, pady=5)
         duplicate_button_btn = ttk.Button(buttons_frame, text="📋", width=3, command=self.duplicate_button)
-        duplicate_button_btn.grid(row=1, column=1, sticky="w", padx=5, pady=5)
+        duplicate_button_btn.grid(row=2, column=1, sticky="w", padx=5, pady=5)
         delete_button_btn = ttk.Button(buttons_frame, text="🗑️", width=3, command=self.delete_button)
-        delete_button_btn.grid(row=1, column=2, sticky="w", padx=5, pady=5)
+        delete_button_btn.grid(row=2, column=2, sticky="w", padx=5, pady=5)
+        self.buttons_status = ttk.Label(buttons_frame, text="")
+        self.buttons_status.grid(row=2, column=3, sticky="e", padx=5, pady=5)
         self.editor_frame = ttk.LabelFrame(right_panel, text="Button Editor")
         self.editor_frame.grid(row=1, column=0, sticky="ew")
         self.editor_frame.columnconfigure(1, weight=1)
@@ -254,13 +1088,17 @@ class ButtonManager:
         seq_frame.grid(row=5, column=0, columnspan=2, sticky="ew", padx=5, pady=5)
         seq_frame.columnconfigure(0, weight=1)
         self.seq_listbox = tk.Listbox(seq_frame, height=4)
-        self.seq_listbox.grid(row=0, column=0, sticky="ew", padx=5, pady=5, columnspan=3)
+        self.seq_listbox.grid(row=0, column=0, sticky="ew", padx=5, pady=5, columnspan=5)
         add_seq_btn = ttk.Button(seq_frame, text="+", width=3, command=self.add_sequence)
         add_seq_btn.grid(row=1, column=0, sticky="w", padx=5, pady=5)
         edit_seq_btn = ttk.Button(seq_frame, text="✏️", width=3, command=self.edit_sequence)
         edit_seq_btn.grid(row=1, column=1, sticky="w", padx=5, pady=5)
         delete_seq_btn = ttk.Button(seq_frame, text="🗑️", width=3, command=self.delete_sequence)
         delete_seq_btn.grid(row=1, column=2, sticky="w", padx=5, pady=5)
+        add_delay_btn = ttk.Button(seq_frame, text="⏱", width=3, command=self.add_delay_step)
+        add_delay_btn.grid(row=1, column=3, sticky="w", padx=5, pady=5)
+        add_text_btn = ttk.Button(seq_frame, text="Aa", width=3, command=self.add_text_step)
+        add_text_btn.grid(row=1, column=4, sticky="w", padx=5, pady=5)
         buttons_frame = ttk.Frame(self.editor_frame)
         buttons_frame.grid(row=6, column=0, columnspan=2, sticky="e", padx=5, pady=10)
         save_btn = ttk.Button(buttons_frame, text="Save Button", command=self.save_button)
@@ -271,59 +1109,107 @@ class ButtonManager:
         bottom_frame.grid(row=1, column=0, sticky="ew", padx=10, pady=(0, 10))
         save_all_btn = ttk.Button(bottom_frame, text="Save All Changes", command=self.save_all)
         save_all_btn.grid(row=0, column=0, padx=5)
+        self.image_atlas = tk.BooleanVar(value=self.model.default_preferences.get("image_atlas", False))
+        atlas_check = ttk.Checkbutton(bottom_frame, text="Pack each group's images into one atlas", variable=self.image_atlas)
+        atlas_check.grid(row=0, column=1, padx=5)
+        self.listbox_rows = {}
+        self.visible_buttons = []
+        self.search_index = SearchIndex()
+        for button in self.model.buttons_by_id.values():
+            self.index_button(button)
         self.refresh_profiles()
         self.current_button_index = None
         self.sequence_data = []
         self.disable_editor()
     
+    def index_button(self, button):
+        keys = " ".join(button.get("hotkey") or [])
+        self.search_index.add(button["id"], f"{button['text']} {keys}")
+
+    def sync_listbox(self, listbox, rows):
+        shown = self.listbox_rows.get(listbox, [])
+        if rows == shown:
+            return
+        limit = min(len(rows), len(shown))
+        start = 0
+        while start < limit and rows[start] == shown[start]:
+            start += 1
+        end = 0
+        while end < limit - start and rows[-1 - end] == shown[-1 - end]:
+            end += 1
+        if len(shown) - end > start:
+            listbox.delete(start, len(shown) - end - 1)
+        changed = rows[start:len(rows) - end]
+        if changed:
+            listbox.insert(start, *changed)
+        self.listbox_rows[listbox] = list(rows)
+
     def refresh_profiles(self):
-        self.profile_listbox.delete(0, tk.END)
-        active_profile = self.config_data.get("active_profile", "Default")
-        active_index = 0
-        for i, profile in enumerate(self.config_data["profiles"]):
-            self.profile_listbox.insert(tk.END, profile["name"])
-            if profile["name"] == active_profile:
-                active_index = i
+        self.sync_listbox(self.profile_listbox, [profile["name"] for profile in self.model.profiles])
+        active_index = self.model.profile_position(self.model.active_profile) or 0
         if self.profile_listbox.size() > 0:
+            self.profile_listbox.selection_clear(0, tk.END)
             self.profile_listbox.selection_set(active_index)
             self.profile_listbox.see(active_index)
             self.on_profile_select()
     
     def refresh_groups(self):
-        self.group_listbox.delete(0, tk.END)
         selected_profile = self.get_selected_profile()
-        active_group = self.config_data.get("active_group", "Main")
-        active_index = 0
+        groups = selected_profile["groups"] if selected_profile else []
+        self.sync_listbox(self.group_listbox, [group["name"] for group in groups])
         if selected_profile:
-            for i, group in enumerate(selected_profile["groups"]):
-                self.group_listbox.insert(tk.END, group["name"])
-                if group["name"] == active_group:
-                    active_index = i
+            active_index = self.model.group_position(selected_profile["name"], self.model.active_group) or 0
             if self.group_listbox.size() > 0:
+                self.group_listbox.selection_clear(0, tk.END)
                 self.group_listbox.selection_set(active_index)
                 self.group_listbox.see(active_index)
                 self.on_group_select()
     
     def refresh_buttons(self):
-        self.buttons_listbox.delete(0, tk.END)
         selected_group = self.get_selected_group()
-        if selected_group:
-            for button in selected_group["buttons"]:
-                self.buttons_listbox.insert(tk.END, button["text"])
+        buttons = selected_group["buttons"] if selected_group else []
+        matches = self.search_index.search(self.search_var.get())
+        visible = [i for i, button in enumerate(buttons) if matches is None or button["id"] in matches]
+        self.visible_buttons = visible
+        self.sync_listbox(self.buttons_listbox, [buttons[i]["text"] for i in self.visible_buttons])
+        if matches is not None:
+            self.buttons_status.configure(text=f"{len(visible)} of {len(buttons)} buttons")
+        else:
+            self.buttons_status.configure(text=f"{len(buttons)} buttons")
+
+    def on_search(self, *args):
+        self.refresh_buttons()
+        self.disable_editor()
     
+    def describe_step(self, step):
+        if isinstance(step, list):
+            return ' + '.join(step)
+        parts = []
+        if step.get("keys"):
+            parts.append(' + '.join(step["keys"]))
+        if step.get("text"):
+            parts.append(f"type \"{step['text']}\"")
+        if step.get("hold"):
+            parts.append(f"hold {step['hold']:g}s")
+        if step.get("repeat", 1) > 1:
+            parts.append(f"x{step['repeat']}")
+        if step.get("delay"):
+            parts.append(f"wait {step['delay']:g}s")
+        return ', '.join(parts)
+
     def refresh_sequences(self):
         self.seq_listbox.delete(0, tk.END)
         for i, seq in enumerate(self.sequence_data):
             prefix = "➊ " if i == 0 else f"➋ Step {i}: "
-            self.seq_listbox.insert(tk.END, f"{prefix}{' + '.join(seq)}")
+            self.seq_listbox.insert(tk.END, f"{prefix}{self.describe_step(seq)}")
     
     def get_selected_profile(self):
         selection = self.profile_listbox.curselection()
         if not selection:
             return None
         index = selection[0]
-        if index < len(self.config_data["profiles"]):
-            return self.config_data["profiles"][index]
+        if index < len(self.model.profiles):
+            return self.model.profiles[index]
         return None
     
     def get_selected_group(self):
@@ -343,9 +1229,9 @@ class ButtonManager:
         if not group:
             return None
         selection = self.buttons_listbox.curselection()
-        if not selection:
+        if not selection or selection[0] >= len(self.visible_buttons):
             return None
-        index = selection[0]
+        index = self.visible_buttons[selection[0]]
         if index < len(group["buttons"]):
             self.current_button_index = index
             return group["buttons"][index]
@@ -467,6 +1353,10 @@ class ButtonManager:
         if index >= len(self.sequence_data):
             return
         existing_sequence = self.sequence_data[index]
+        if isinstance(existing_sequence, dict) and not existing_sequence.get("keys"):
+            self.edit_step(index)
+            return
+        existing_keys = existing_sequence["keys"] if isinstance(existing_sequence, dict) else existing_sequence
         dialog = tk.Toplevel(self.root)
         dialog.title("Edit Key Combination")
         dialog.geometry("400x300")
@@ -499,7 +1389,7 @@ class ButtonManager:
                 key_rows.pop(idx)
                 key_vars.pop(idx)
                 key_dropdowns.pop(idx)
-        for key in existing_sequence:
+        for key in existing_keys:
             add_key_dropdown(key)
         if not key_vars:
             add_key_dropdown()
@@ -508,7 +1398,10 @@ class ButtonManager:
         def on_ok():
             selected_keys = [var.get() for var in key_vars if var.get()]
             if selected_keys:
-                self.sequence_data[index] = selected_keys
+                if isinstance(existing_sequence, dict):
+                    self.sequence_data[index] = dict(existing_sequence, keys=selected_keys)
+                else:
+                    self.sequence_data[index] = selected_keys
                 self.refresh_sequences()
             dialog.destroy()
         def on_cancel():
@@ -520,6 +1413,36 @@ class ButtonManager:
         cancel_button = ttk.Button(button_frame, text="Cancel", command=on_cancel)
         cancel_button.pack(side="right", padx=5)
     
+    def ask_delay(self, initial=0.5):
+        return simpledialog.askfloat("Delay", "Seconds to wait:", parent=self.root, initialvalue=initial, minvalue=0, maxvalue=MAX_STEP_SECONDS)
+
+    def ask_text(self, initial=""):
+        return simpledialog.askstring("Type Text", "Text to type:", parent=self.root, initialvalue=initial)
+
+    def add_delay_step(self):
+        delay = self.ask_delay()
+        if delay:
+            self.sequence_data.append({"delay": delay})
+            self.refresh_sequences()
+
+    def add_text_step(self):
+        text = self.ask_text()
+        if text:
+            self.sequence_data.append({"text": text})
+            self.refresh_sequences()
+
+    def edit_step(self, index):
+        step = self.sequence_data[index]
+        if step.get("text"):
+            text = self.ask_text(step["text"])
+            if text:
+                self.sequence_data[index] = dict(step, text=text)
+        else:
+            delay = self.ask_delay(step.get("delay", 0.5))
+            if delay:
+                self.sequence_data[index] = dict(step, delay=delay)
+        self.refresh_sequences()
+
     def delete_sequence(self):
         selection = self.seq_listbox.curselection()
         if not selection:
@@ -546,11 +1469,10 @@ class ButtonManager:
             if not name:
                 messagebox.showerror("Error", "Profile name cannot be empty")
                 return
-            for profile in self.config_data["profiles"]:
-                if profile["name"] == name:
-                    messagebox.showerror("Error", f"Profile '{name}' already exists")
-                    return
-            self.config_data["profiles"].append({
+            if self.model.get_profile(name):
+                messagebox.showerror("Error", f"Profile '{name}' already exists")
+                return
+            self.model.profiles.append({
                 "name": name,
                 "groups": [
                     {
@@ -559,6 +1481,7 @@ class ButtonManager:
                     }
                 ]
             })
+            self.model.reindex()
             self.refresh_profiles()
             dialog.destroy()
         ttk.Button(dialog, text="OK", command=on_ok).pack(pady=10)
@@ -586,13 +1509,14 @@ class ButtonManager:
                 messagebox.showerror("Error", "Profile name cannot be empty")
                 return
             if name != old_name:
-                for p in self.config_data["profiles"]:
-                    if p["name"] == name and p != profile:
-                        messagebox.showerror("Error", f"Profile '{name}' already exists")
-                        return
+                existing = self.model.get_profile(name)
+                if existing and existing is not profile:
+                    messagebox.showerror("Error", f"Profile '{name}' already exists")
+                    return
                 profile["name"] = name
-                if self.config_data["active_profile"] == old_name:
-                    self.config_data["active_profile"] = name
+                if self.model.active_profile == old_name:
+                    self.model.active_profile = name
+                self.model.reindex()
                 self.refresh_profiles()
             dialog.destroy()
         ttk.Button(dialog, text="OK", command=on_ok).pack(pady=10)
@@ -601,14 +1525,16 @@ class ButtonManager:
         profile = self.get_selected_profile()
         if not profile:
             return
-        if len(self.config_data["profiles"]) <= 1:
+        if len(self.model.profiles) <= 1:
             messagebox.showerror("Error", "Cannot delete the last profile")
             return
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete the profile '{profile['name']}'?"):
             selection = self.profile_listbox.curselection()[0]
-            del self.config_data["profiles"][selection]
-            if self.config_data["active_profile"] == profile["name"]:
-                self.config_data["active_profile"] = self.config_data["profiles"][0]["name"]
+            del self.model.profiles[selection]
+            if self.model.active_profile == profile["name"]:
+                self.model.active_profile = self.model.profiles[0]["name"]
+            self.model.reindex()
+            self.search_index.retain(self.model.buttons_by_id)
             self.refresh_profiles()
     
     def add_group(self):
@@ -631,14 +1557,14 @@ class ButtonManager:
             if not name:
                 messagebox.showerror("Error", "Group name cannot be empty")
                 return
-            for group in profile["groups"]:
-                if group["name"] == name:
-                    messagebox.showerror("Error", f"Group '{name}' already exists in this profile")
-                    return
+            if self.model.get_group(profile["name"], name):
+                messagebox.showerror("Error", f"Group '{name}' already exists in this profile")
+                return
             profile["groups"].append({
                 "name": name,
                 "buttons": []
             })
+            self.model.reindex()
             self.refresh_groups()
             dialog.destroy()
         ttk.Button(dialog, text="OK", command=on_ok).pack(pady=10)
@@ -673,13 +1599,13 @@ class ButtonManager:
                 messagebox.showerror("Error", "Group name cannot be empty")
                 return
             if name != old_name:
-                for g in profile["groups"]:
-                    if g["name"] == name:
-                        messagebox.showerror("Error", f"Group '{name}' already exists in this profile")
-                        return
+                if self.model.get_group(profile["name"], name):
+                    messagebox.showerror("Error", f"Group '{name}' already exists in this profile")
+                    return
                 group["name"] = name
-                if self.config_data["active_group"] == old_name:
-                    self.config_data["active_group"] = name
+                if self.model.active_group == old_name:
+                    self.model.active_group = name
+                self.model.reindex()
                 self.refresh_groups()
             dialog.destroy()
         ttk.Button(dialog, text="OK", command=on_ok).pack(pady=10)
@@ -700,8 +1626,10 @@ class ButtonManager:
         group = profile["groups"][index]
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete the group '{group['name']}'?"):
             del profile["groups"][index]
-            if self.config_data["active_group"] == group["name"]:
-                self.config_data["active_group"] = profile["groups"][0]["name"]
+            if self.model.active_group == group["name"]:
+                self.model.active_group = profile["groups"][0]["name"]
+            self.model.reindex()
+            self.search_index.retain(self.model.buttons_by_id)
             self.refresh_groups()
     
     def add_button(self):
@@ -729,8 +1657,11 @@ class ButtonManager:
             return
         group = self.get_selected_group()
         new_button = button.copy()
+        new_button["id"] = new_button_id()
         new_button["text"] = f"{button['text']} (Copy)"
         group["buttons"].append(new_button)
+        self.model.buttons_by_id[new_button["id"]] = new_button
+        self.index_button(new_button)
         self.refresh_buttons()
     
     def delete_button(self):
@@ -738,10 +1669,12 @@ class ButtonManager:
         if not group:
             return
         selection = self.buttons_listbox.curselection()
-        if not selection:
+        if not selection or selection[0] >= len(self.visible_buttons):
             return
-        index = selection[0]
+        index = self.visible_buttons[selection[0]]
         if messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this button?"):
+            self.search_index.remove(group["buttons"][index]["id"])
+            self.model.buttons_by_id.pop(group["buttons"][index]["id"], None)
             del group["buttons"][index]
             self.refresh_buttons()
             self.disable_editor()
@@ -767,7 +1700,15 @@ class ButtonManager:
         if not self.sequence_data:
             messagebox.showerror("Error", "Button must have at least one key combination")
             return
+        if not isinstance(self.sequence_data[0], list):
+            messagebox.showerror("Error", "The first step must be a key combination")
+            return
+        if self.current_button_index is not None and self.current_button_index < len(group["buttons"]):
+            button_id = group["buttons"][self.current_button_index]["id"]
+        else:
+            button_id = new_button_id()
         button_data = {
+            "id": button_id,
             "text": text,
             "color": bg_color,
             "text_color": text_color,
@@ -781,6 +1722,8 @@ class ButtonManager:
             group["buttons"][self.current_button_index] = button_data
         else:
             group["buttons"].append(button_data)
+        self.model.buttons_by_id[button_id] = button_data
+        self.index_button(button_data)
         self.refresh_buttons()
         self.disable_editor()
     
@@ -788,328 +1731,1420 @@ class ButtonManager:
         self.disable_editor()
     
     def save_all(self):
-        save_config(self.config_data)
-        messagebox.showinfo("Success", "Configuration has been saved successfully!")
-        global config
-        config = load_config()
-    
+        self.model.default_preferences["image_atlas"] = self.image_atlas.get()
+        config_updates.submit(copy.deepcopy(self.model.to_dict()), lambda error: gui.commands.put(("saved", error)))
+
+    def saved(self, error):
+        if error:
+            messagebox.showerror("Error", f"Could not save the configuration: {error}")
+        else:
+            messagebox.showinfo("Success", "Configuration has been saved successfully!")
+
+    def show(self):
+        self.root.deiconify()
+        self.root.lift()
+        self.root.focus_force()
+
+def config_snapshot():
+    return copy.deepcopy(config.to_dict())
+
+def apply_config(config_data):
+    with config_lock:
+        new_config = validate_config(config_data)
+        save_config(new_config.to_dict())
+        swap_config(new_config)
+
+class ConfigUpdates:
+    def __init__(self):
+        self.updates = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def submit(self, config_data, reply=None):
+        self.start()
+        self.updates.put((config_data, reply))
+
     def run(self):
+        while True:
+            config_data, reply = self.updates.get()
+            error = None
+            try:
+                apply_config(config_data)
+            except Exception as e:
+                error = str(e)
+                print(f"Error while saving the configuration: {e}")
+            if reply is not None:
+                reply(error)
+
+config_updates = ConfigUpdates()
+
+class GuiThread:
+    def __init__(self, poll_interval=100):
+        self.poll_interval = poll_interval
+        self.commands = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.root = None
+        self.manager = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def open_manager(self):
+        self.start()
+        self.commands.put(("open", config_snapshot()))
+
+    def run(self):
+        try:
+            load_gui()
+            self.root = tk.Tk()
+        except Exception as e:
+            print(f"Error while starting the GUI: {e}")
+            return
+        self.root.withdraw()
+        self.root.after(self.poll_interval, self.poll)
         self.root.mainloop()
 
-def start_button_manager():
-    manager = ButtonManager()
-    manager.run()
+    def poll(self):
+        while True:
+            try:
+                command, payload = self.commands.get_nowait()
+            except queue.Empty:
+                break
+            if command == "open":
+                self.show_manager(payload)
+            elif command == "saved" and self.manager is not None:
+                self.manager.saved(payload)
+        self.root.after(self.poll_interval, self.poll)
+
+    def show_manager(self, snapshot):
+        if self.manager is not None and self.manager.root.winfo_exists():
+            self.manager.show()
+            return
+        self.manager = ButtonManager(snapshot, self.root)
+        self.manager.root.protocol("WM_DELETE_WINDOW", self.close_manager)
+        self.manager.show()
+
+    def close_manager(self):
+        if self.manager is not None:
+            self.manager.root.destroy()
+            self.manager = None
+
+gui = GuiThread()
 
 def is_port_in_use(port):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         return s.connect_ex(('localhost', port)) == 0
 
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>MobileDeck</title>
-    <style>
-        :root {
-            --bg-color: #121212;
-            --text-color: #ffffff;
-            --button-border: rgba(255, 255, 255, 0.8);
-            --toggle-bg: #333;
-            --toggle-dot: #fff;
-            --settings-bg: rgba(30, 30, 30, 0.9);
-        }
-        [data-theme="light"] {
-            --bg-color: #f5f5f5;
-            --text-color: #121212;
-            --button-border: rgba(0, 0, 0, 0.8);
-            --toggle-bg: #ccc;
-            --toggle-dot: #333;
-            --settings-bg: rgba(240, 240, 240, 0.9);
-        }
-        body {
-            margin: 0;
-            background-color: var(--bg-color);
-            color: var(--text-color);
-            font-family: Arial, sans-serif;
-            display: flex;
-            flex-direction: column;
-            min-height: 100vh;
-            transition: background-color 0.3s ease, color 0.3s ease;
-        }
-        .header {
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            padding: 10px 20px;
-            background-color: var(--bg-color);
-            border-bottom: 1px solid var(--button-border);
-            position: fixed;
-            top: 0;
-            left: 0;
-            right: 0;
-            z-index: 50;
-            height: 60px;
-            box-shadow: 0 2px 5px rgba(0, 0, 0, 0.1);
-        }
-        .logo {
-            height: 40px;
-            width: 192px;
-        }
-        .theme-toggle {
-            position: relative;
-            display: inline-block;
-            width: 60px;
-            height: 34px;
-            margin-left: 10px;
-        }
-        .theme-toggle input {
-            opacity: 0;
-            width: 0;
-            height: 0;
-        }
-        .slider {
-            position: absolute;
-            cursor: pointer;
-            top: 0;
-            left: 0;
-            right: 0;
-            bottom: 0;
-            background-color: var(--toggle-bg);
-            transition: .4s;
-            border-radius: 34px;
-        }
-        .slider:before {
-            position: absolute;
-            content: "";
-            height: 26px;
-            width: 26px;
-            left: 4px;
-            bottom: 4px;
-            background-color: var(--toggle-dot);
-            transition: .4s;
-            border-radius: 50%;
-        }
-        input:checked + .slider {
-            background-color: #2196F3;
-        }
-        input:checked + .slider:before {
-            transform: translateX(26px);
-        }
-        .buttons-container {
-            display: flex;
-            flex-wrap: wrap;
-            justify-content: center;
-            align-items: flex-start;
-            padding: 20px;
-            flex-grow: 1;
-            margin-top: 70px;
-        }
-        .group-selector {
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            width: 100%;
-            margin-bottom: 20px;
-        }
-        .group-selector select {
-            background-color: var(--bg-color);
-            color: var(--text-color);
-            border: 1px solid var(--button-border);
-            padding: 8px 15px;
-            border-radius: 5px;
-            font-size: 16px;
-            margin: 0 10px;
-        }
-        .button {
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            width: {{ button_width }}px;
-            height: {{ button_height }}px;
-            margin: 10px;
-            border: 2px solid var(--button-border);
-            border-radius: 10px;
-            font-size: 14px;
-            font-weight: bold;
-            cursor: pointer;
-            text-align: center;
-            text-transform: uppercase;
-            position: relative;
-            transition: all 0.2s ease;
-            overflow: hidden;
-            box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        }
-        .button:active:not(.toggle-button.active) {
-            transform: scale(0.95);
-            opacity: 0.8;
-        }
-        .button .image-container {
-            position: absolute;
-            width: 100%;
-            height: 100%;
-            overflow: hidden;
-            border-radius: 8px;
-            z-index: 0;
-        }
-        .button img {
-            width: 100%;
-            height: 100%;
-            object-fit: cover;
-            opacity: 0.6;
-        }
-        .button .text {
-            z-index: 1;
-            position: relative;
-            padding: 8px;
-            text-shadow: 0 0 3px rgba(0, 0, 0, 0.5);
-        }
-        .toggle-button {
-            border-style: dashed;
-        }
-        .toggle-button.active {
-            border-style: solid;
-            box-shadow: 0 0 10px rgba(33, 150, 243, 0.8);
-            transform: scale(0.98);
-        }
-        .settings-button {
-            position: fixed;
-            bottom: 20px;
-            right: 20px;
-            width: 60px;
-            height: 60px;
-            background-color: #2196F3;
-            color: white;
-            border: none;
-            border-radius: 50%;
-            font-size: 24px;
-            cursor: pointer;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            box-shadow: 0 4px 10px rgba(0, 0, 0, 0.3);
-            z-index: 100;
-        }
-        .settings-panel {
-            position: fixed;
-            top: 0;
-            right: -300px;
-            width: 300px;
-            height: 100%;
-            background-color: var(--settings-bg);
-            box-shadow: -5px 0 15px rgba(0, 0, 0, 0.2);
-            transition: right 0.3s ease;
-            z-index: 100;
-            overflow-y: auto;
-            padding: 20px;
-            box-sizing: border-box;
+SERVER_PORT = 23843
+SOCKET_PORT = 23844
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+MAX_FRAME_SIZE = 65536
+deck_sockets = set()
+deck_sockets_lock = threading.Lock()
+
+class DeckSocket:
+    def __init__(self, connection, rfile):
+        self.connection = connection
+        self.rfile = rfile
+        self.send_lock = threading.Lock()
+
+    def send_frame(self, opcode, payload):
+        header = bytearray([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header.append(length)
+        elif length < 65536:
+            header.append(126)
+            header += struct.pack('!H', length)
+        else:
+            header.append(127)
+            header += struct.pack('!Q', length)
+        with self.send_lock:
+            self.connection.sendall(bytes(header) + payload)
+
+    def send(self, message):
+        self.send_frame(0x1, json.dumps(message).encode('utf-8'))
+
+    def read_exact(self, size):
+        data = self.rfile.read(size)
+        if len(data) < size:
+            raise ConnectionError("socket closed")
+        return data
+
+    def receive(self):
+        message = b''
+        while True:
+            first, second = self.read_exact(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length = struct.unpack('!H', self.read_exact(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', self.read_exact(8))[0]
+            if length > MAX_FRAME_SIZE or not second & 0x80:
+                raise ConnectionError("invalid frame")
+            mask = self.read_exact(4)
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self.read_exact(length)))
+            if opcode == 0x8:
+                return None
+            if opcode == 0x9:
+                self.send_frame(0xA, payload)
+                continue
+            if opcode == 0xA:
+                continue
+            message += payload
+            if len(message) > MAX_FRAME_SIZE:
+                raise ConnectionError("message too large")
+            if first & 0x80:
+                return message.decode('utf-8')
+
+def broadcast(message, exclude=None):
+    with deck_sockets_lock:
+        targets = [deck_socket for deck_socket in deck_sockets if deck_socket is not exclude]
+    for deck_socket in targets:
+        try:
+            deck_socket.send(message)
+        except OSError:
+            with deck_sockets_lock:
+                deck_sockets.discard(deck_socket)
+
+@on_config_change
+def broadcast_config_change(new_config):
+    broadcast({"type": "config", "version": new_config.version})
+
+def handle_socket_message(deck_socket, message, received_at=None):
+    button_id = message.get('id')
+    expected = message.get('expected')
+    if button_id is not None and not isinstance(button_id, str):
+        return {"type": "error", "seq": message.get('seq'), "error": "invalid id"}
+    if message.get('type') in ('state', 'press') and button_id is not None and 'state' in message:
+        changed, version = update_button_state(button_id, bool(message['state']), deck_socket, expected)
+        if not changed:
+            return {
+                "type": "ack",
+                "seq": message.get('seq'),
+                "status": "conflict",
+                "id": button_id,
+                "state": button_states.get(button_id),
+                "version": version
+            }
+        if message['type'] == 'state':
+            return {"type": "ack", "seq": message.get('seq'), "status": "ok", "version": version}
+    if message.get('type') == 'press' and button_id is not None:
+        status, job = trigger_button(button_id, received_at)
+        ack = {"type": "ack", "seq": message.get('seq'), "status": status}
+        if job:
+            ack["job"] = job["id"]
+        return ack
+    if message.get('type') == 'cancel' and isinstance(message.get('job'), int):
+        job = injector.cancel(message['job'])
+        return {"type": "ack", "seq": message.get('seq'), "status": "cancelled" if job else "not_found", "job": message['job']}
+    return {"type": "error", "seq": message.get('seq'), "error": "unknown message"}
+
+class DeckSocketHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        headers = {}
+        self.rfile.readline(8192)
+        while True:
+            line = self.rfile.readline(8192).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get('sec-websocket-key')
+        origin = headers.get('origin')
+        host = headers.get('host', '')
+        if not key or headers.get('upgrade', '').lower() != 'websocket':
+            self.wfile.write(b'HTTP/1.1 400 Bad Request\r\nConnection: close\r\n\r\n')
+            return
+        if origin and urlsplit(origin).hostname != urlsplit(f'//{host}').hostname:
+            self.wfile.write(b'HTTP/1.1 403 Forbidden\r\nConnection: close\r\n\r\n')
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode('ascii')).digest()).decode('ascii')
+        self.wfile.write(
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept}\r\n\r\n'.encode('ascii')
+        )
+        deck_socket = DeckSocket(self.connection, self.rfile)
+        with deck_sockets_lock:
+            deck_sockets.add(deck_socket)
+        try:
+            while True:
+                text = deck_socket.receive()
+                if text is None:
+                    deck_socket.send_frame(0x8, b'')
+                    break
+                received_at = time.perf_counter()
+                try:
+                    message = json.loads(text)
+                except ValueError:
+                    continue
+                metrics.observe('parse', time.perf_counter() - received_at)
+                if isinstance(message, dict):
+                    deck_socket.send(handle_socket_message(deck_socket, message, received_at))
+        except (ConnectionError, OSError, UnicodeDecodeError):
+            pass
+        finally:
+            with deck_sockets_lock:
+                deck_sockets.discard(deck_socket)
+
+class DeckSocketServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class DeckRequestHandler(WSGIRequestHandler):
+    def setup(self):
+        self.timeout = self.server.request_timeout
+        super().setup()
+
+class PooledWSGIServer(BaseWSGIServer):
+    multithread = True
+
+    def __init__(self, host, port, app, threads=8, timeout=30.0):
+        self.request_timeout = timeout
+        super().__init__(host, port, app, handler=DeckRequestHandler)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='deck-http')
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=True)
+
+def get_lan_address():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        try:
+            s.connect(('10.255.255.255', 1))
+            return s.getsockname()[0]
+        except OSError:
+            return '127.0.0.1'
+
+def raise_system_exit(signum, frame):
+    raise SystemExit(0)
+
+def serve_production(host, port, threads, timeout):
+    try:
+        import waitress
+    except ImportError:
+        waitress = None
+    socket_server = start_socket_server(SOCKET_PORT)
+    config_watcher.start()
+    print(f" * Running on http://127.0.0.1:{port}")
+    print(f" * Running on http://{get_lan_address()}:{port}")
+    try:
+        if waitress:
+            server = waitress.create_server(app, host=host, port=port, threads=threads, channel_timeout=timeout)
+            print(f" * Production server (waitress): {threads} worker threads, {timeout:g}s idle timeout, keep-alive on")
+            signal.signal(signal.SIGTERM, raise_system_exit)
+            server.run()
+        else:
+            server = PooledWSGIServer(host, port, app, threads, timeout)
+            def request_shutdown(signum, frame):
+                threading.Thread(target=server.shutdown, daemon=True).start()
+            signal.signal(signal.SIGINT, request_shutdown)
+            signal.signal(signal.SIGTERM, request_shutdown)
+            print(f" * Production server: {threads} worker threads, {timeout:g}s request timeout (install waitress for keep-alive)")
+            try:
+                server.serve_forever()
+            finally:
+                server.server_close()
+    finally:
+        print("Shutting down, finishing queued key presses...")
+        if socket_server:
+            socket_server.shutdown()
+            socket_server.server_close()
+        config_watcher.stop()
+        injector.stop()
+        clients.store.flush()
+
+def start_socket_server(port=SOCKET_PORT):
+    try:
+        server = DeckSocketServer(('0.0.0.0', port), DeckSocketHandler)
+    except OSError as e:
+        print(f"Could not start the button socket on port {port}: {e}")
+        return None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+IMAGE_SCALE = 2
+IMAGE_CACHE_LIMIT = 64 * 1024 * 1024
+MAX_IMAGE_DOWNLOAD = 10 * 1024 * 1024
+IMAGE_SIGNATURES = {
+    b'\x89PNG': 'png',
+    b'\xff\xd8\xff': 'jpg',
+    b'GIF8': 'gif',
+    b'RIFF': 'webp'
+}
+
+def read_image_source(source):
+    if source.startswith('data:'):
+        header, _, payload = source.partition(',')
+        if header.endswith(';base64'):
+            return base64.b64decode(payload)
+        return unquote_to_bytes(payload)
+    if source.startswith(('http://', 'https://')):
+        with urllib.request.urlopen(source, timeout=10) as response:
+            data = response.read(MAX_IMAGE_DOWNLOAD + 1)
+        if len(data) > MAX_IMAGE_DOWNLOAD:
+            raise ValueError("image is larger than 10 MB")
+        return data
+    with open(source, 'rb') as f:
+        return f.read(MAX_IMAGE_DOWNLOAD)
+
+def resize_image(data, width, height):
+    if not load_imaging():
+        for signature, extension in IMAGE_SIGNATURES.items():
+            if data.startswith(signature):
+                return data, extension
+        raise ValueError("unrecognised image format")
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGBA')
+        image = ImageOps.fit(image, (width * IMAGE_SCALE, height * IMAGE_SCALE), Image.LANCZOS)
+    output = io.BytesIO()
+    if features.check('webp'):
+        image.save(output, 'WEBP', quality=85)
+        return output.getvalue(), 'webp'
+    image.save(output, 'PNG', optimize=True)
+    return output.getvalue(), 'png'
+
+class ImageCache:
+    def __init__(self, directory, max_bytes=IMAGE_CACHE_LIMIT):
+        self.directory = directory
+        self.index_path = os.path.join(directory, 'index.json')
+        self.atlas_path = os.path.join(directory, 'atlases.json')
+        self.sources_path = os.path.join(directory, 'sources.json')
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.failed = set()
+        self.executor = None
+        self.source_locks = {}
+        self.index = self.read_json(self.index_path)
+        self.atlases = self.read_json(self.atlas_path)
+        self.sources = self.read_json(self.sources_path)
+        self.refresh_files()
+
+    def read_json(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def refresh_files(self):
+        self.files = set(self.index.values()) | {manifest['filename'] for manifest in self.atlases.values()}
+
+    def source_key(self, source, width, height):
+        return hashlib.sha256(f"{width}x{height}:{source}".encode('utf-8')).hexdigest()[:32]
+
+    def url_for(self, source, width, height):
+        if not source or source.startswith('/images/'):
+            return source
+        width = clamp_setting('button_width', width)
+        height = clamp_setting('button_height', height)
+        key = self.source_key(source, width, height)
+        filename = self.index.get(key)
+        if filename:
+            return f"/images/{filename}"
+        self.schedule(source, width, height, key)
+        return source
+
+    def submit(self, task, *args):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='deck-images')
+        self.executor.submit(task, *args)
+
+    def schedule(self, source, width, height, key=None):
+        key = key or self.source_key(source, width, height)
+        with self.lock:
+            if key in self.index or key in self.pending or key in self.failed:
+                return
+            self.pending.add(key)
+        self.submit(self.ingest, source, width, height, key)
+
+    def store(self, data, name):
+        path = os.path.join(self.directory, name)
+        os.makedirs(self.directory, exist_ok=True)
+        if not os.path.exists(path):
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        return path
+
+    def read_source(self, source):
+        if not source.startswith(('http://', 'https://')):
+            return read_image_source(source)
+        key = hashlib.sha256(source.encode('utf-8')).hexdigest()[:32]
+        with self.lock:
+            source_lock = self.source_locks.setdefault(key, threading.Lock())
+        with source_lock:
+            filename = self.sources.get(key)
+            if filename:
+                path = os.path.join(self.directory, filename)
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                    os.utime(path)
+                    return data
+                except OSError:
+                    pass
+            data = read_image_source(source)
+            filename = f"source-{hashlib.sha256(data).hexdigest()[:32]}"
+            self.store(data, filename)
+            with self.lock:
+                self.sources[key] = filename
+                sources_text = json.dumps(self.sources)
+            write_file_atomic(self.sources_path, sources_text)
+            return data
+
+    def ingest(self, source, width, height, key):
+        try:
+            data, extension = resize_image(self.read_source(source), width, height)
+            filename = f"{hashlib.sha256(data).hexdigest()[:32]}.{extension}"
+            self.store(data, filename)
+            with self.lock:
+                self.index[key] = filename
+                self.refresh_files()
+                self.pending.discard(key)
+                index_text = json.dumps(self.index)
+            write_file_atomic(self.index_path, index_text)
+            self.evict()
+            invalidate_page_cache()
+            return filename
+        except Exception as e:
+            print(f"Error while importing button image {source[:80]}: {e}")
+            with self.lock:
+                self.pending.discard(key)
+                self.failed.add(key)
+            return None
+
+    def atlas_key(self, profile_name, group_name, width, height):
+        return f"{profile_name}\x1f{group_name}\x1f{width}x{height}"
+
+    def enable_imaging(self):
+        if load_imaging():
+            invalidate_page_cache()
+
+    def atlas_for(self, profile_name, group_name, buttons, width, height):
+        if Image is None:
+            if not imaging_checked:
+                self.submit(self.enable_imaging)
+            return None
+        width = clamp_setting('button_width', width)
+        height = clamp_setting('button_height', height)
+        sources = [button['image'] for button in buttons if button.get('image')]
+        if not sources:
+            return None
+        atlas_key = self.atlas_key(profile_name, group_name, width, height)
+        keys = [self.source_key(source, width, height) for source in sources]
+        manifest = self.atlases.get(atlas_key)
+        if not manifest or manifest['sources'] != keys:
+            self.schedule_atlas(profile_name, group_name, sources, width, height)
+            return None
+        columns = manifest['columns']
+        rows = manifest['rows']
+        positions = {}
+        image_buttons = [button for button in buttons if button.get('image')]
+        for i, button in enumerate(image_buttons):
+            x = (i % columns) * 100 / (columns - 1) if columns > 1 else 0
+            y = (i // columns) * 100 / (rows - 1) if rows > 1 else 0
+            positions[button['id']] = f"{x:g}% {y:g}%"
+        return {
+            "url": f"/images/{manifest['filename']}",
+            "size": f"{columns * 100}% {rows * 100}%",
+            "positions": positions
         }
-        .settings-panel.open {
-            right: 0;
+
+    def schedule_atlas(self, profile_name, group_name, sources, width, height):
+        atlas_key = self.atlas_key(profile_name, group_name, width, height)
+        with self.lock:
+            if atlas_key in self.pending:
+                return
+            self.pending.add(atlas_key)
+        self.submit(self.build_atlas, atlas_key, sources, width, height)
+
+    def build_atlas(self, atlas_key, sources, width, height):
+        try:
+            keys = [self.source_key(source, width, height) for source in sources]
+            slots = []
+            for source, key in zip(sources, keys):
+                filename = self.index.get(key) or self.ingest(source, width, height, key)
+                if filename is None:
+                    return
+                slots.append(filename)
+            cell_width = width * IMAGE_SCALE
+            cell_height = height * IMAGE_SCALE
+            columns = math.ceil(math.sqrt(len(slots)))
+            rows = math.ceil(len(slots) / columns)
+            previous = self.atlases.get(atlas_key)
+            previous_path = os.path.join(self.directory, previous['filename']) if previous else None
+            atlas = None
+            changed = range(len(slots))
+            if previous and previous['columns'] == columns and previous['rows'] == rows and os.path.isfile(previous_path):
+                with Image.open(previous_path) as previous_atlas:
+                    atlas = previous_atlas.convert('RGBA')
+                old_slots = previous['slots']
+                changed = [i for i in range(columns * rows) if (old_slots[i] if i < len(old_slots) else None) != (slots[i] if i < len(slots) else None)]
+            if atlas is None:
+                atlas = Image.new('RGBA', (cell_width * columns, cell_height * rows), (0, 0, 0, 0))
+            for i in changed:
+                box = ((i % columns) * cell_width, (i // columns) * cell_height)
+                if i >= len(slots):
+                    atlas.paste((0, 0, 0, 0), box + (box[0] + cell_width, box[1] + cell_height))
+                    continue
+                with Image.open(os.path.join(self.directory, slots[i])) as thumbnail:
+                    atlas.paste(thumbnail.convert('RGBA').resize((cell_width, cell_height)), box)
+            output = io.BytesIO()
+            if features.check('webp'):
+                atlas.save(output, 'WEBP', lossless=True)
+                extension = 'webp'
+            else:
+                atlas.save(output, 'PNG', optimize=True)
+                extension = 'png'
+            data = output.getvalue()
+            filename = f"atlas-{hashlib.sha256(data).hexdigest()[:32]}.{extension}"
+            self.store(data, filename)
+            with self.lock:
+                self.atlases[atlas_key] = {
+                    "filename": filename,
+                    "sources": keys,
+                    "slots": slots,
+                    "columns": columns,
+                    "rows": rows
+                }
+                self.refresh_files()
+                atlas_text = json.dumps(self.atlases)
+                in_use = {manifest['filename'] for manifest in self.atlases.values()}
+            write_file_atomic(self.atlas_path, atlas_text)
+            if previous and previous['filename'] not in in_use and os.path.isfile(previous_path):
+                os.remove(previous_path)
+            invalidate_page_cache()
+        except Exception as e:
+            print(f"Error while packing button images: {e}")
+        finally:
+            with self.lock:
+                self.pending.discard(atlas_key)
+
+    def path_for(self, filename):
+        if filename not in self.files:
+            return None
+        path = os.path.join(self.directory, filename)
+        if os.path.isfile(path):
+            os.utime(path)
+            return path
+        return None
+
+    def evict(self):
+        with self.lock:
+            cached = self.files | set(self.sources.values())
+            try:
+                entries = [entry for entry in os.scandir(self.directory) if entry.is_file() and entry.name in cached]
+            except OSError:
+                return
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            total = sum(entry.stat().st_size for entry in entries)
+            removed = set()
+            for entry in entries:
+                if total <= self.max_bytes:
+                    break
+                total -= entry.stat().st_size
+                os.remove(entry.path)
+                removed.add(entry.name)
+            if not removed:
+                return
+            self.index = {key: filename for key, filename in self.index.items() if filename not in removed}
+            self.sources = {key: filename for key, filename in self.sources.items() if filename not in removed}
+            self.atlases = {key: manifest for key, manifest in self.atlases.items() if manifest['filename'] not in removed}
+            self.refresh_files()
+            index_text = json.dumps(self.index)
+            sources_text = json.dumps(self.sources)
+            atlas_text = json.dumps(self.atlases)
+        write_file_atomic(self.index_path, index_text)
+        write_file_atomic(self.sources_path, sources_text)
+        write_file_atomic(self.atlas_path, atlas_text)
+        invalidate_page_cache()
+
+    def prune_atlases(self, group_keys):
+        with self.lock:
+            stale = [key for key in self.atlases if tuple(key.split('\x1f')[:2]) not in group_keys]
+            if not stale:
+                return
+            filenames = {self.atlases.pop(key)['filename'] for key in stale}
+            self.refresh_files()
+            filenames -= self.files
+            atlas_text = json.dumps(self.atlases)
+        write_file_atomic(self.atlas_path, atlas_text)
+        for filename in filenames:
+            path = os.path.join(self.directory, filename)
+            if os.path.isfile(path):
+                os.remove(path)
+
+    def ingest_config(self, deck_config):
+        self.prune_atlases(deck_config.groups_by_name)
+        width = deck_config.default_preferences.get('button_width', 120)
+        height = deck_config.default_preferences.get('button_height', 100)
+        for button in deck_config.buttons_by_id.values():
+            if button.get('image'):
+                self.schedule(button['image'], width, height)
+        if deck_config.default_preferences.get('image_atlas') and load_imaging():
+            for (profile_name, group_name), group in deck_config.groups_by_name.items():
+                self.atlas_for(profile_name, group_name, group['buttons'], width, height)
+
+image_cache = ImageCache(os.path.join(get_data_directory(), 'assets', 'images'))
+image_cache.prune_atlases(config.groups_by_name)
+mark_startup('image cache')
+
+DECK_CSS = """
+:root {
+    --bg-color: #121212;
+    --text-color: #ffffff;
+    --button-border: rgba(255, 255, 255, 0.8);
+    --toggle-bg: #333;
+    --toggle-dot: #fff;
+    --settings-bg: rgba(30, 30, 30, 0.9);
+}
+[data-theme="light"] {
+    --bg-color: #f5f5f5;
+    --text-color: #121212;
+    --button-border: rgba(0, 0, 0, 0.8);
+    --toggle-bg: #ccc;
+    --toggle-dot: #333;
+    --settings-bg: rgba(240, 240, 240, 0.9);
+}
+body {
+    margin: 0;
+    background-color: var(--bg-color);
+    color: var(--text-color);
+    font-family: Arial, sans-serif;
+    display: flex;
+    flex-direction: column;
+    min-height: 100vh;
+    transition: background-color 0.3s ease, color 0.3s ease;
+}
+.header {
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    padding: 10px 20px;
+    background-color: var(--bg-color);
+    border-bottom: 1px solid var(--button-border);
+    position: fixed;
+    top: 0;
+    left: 0;
+    right: 0;
+    z-index: 50;
+    height: 60px;
+    box-shadow: 0 2px 5px rgba(0, 0, 0, 0.1);
+}
+.logo {
+    height: 40px;
+    width: 192px;
+}
+.theme-toggle {
+    position: relative;
+    display: inline-block;
+    width: 60px;
+    height: 34px;
+    margin-left: 10px;
+}
+.theme-toggle input {
+    opacity: 0;
+    width: 0;
+    height: 0;
+}
+.slider {
+    position: absolute;
+    cursor: pointer;
+    top: 0;
+    left: 0;
+    right: 0;
+    bottom: 0;
+    background-color: var(--toggle-bg);
+    transition: .4s;
+    border-radius: 34px;
+}
+.slider:before {
+    position: absolute;
+    content: "";
+    height: 26px;
+    width: 26px;
+    left: 4px;
+    bottom: 4px;
+    background-color: var(--toggle-dot);
+    transition: .4s;
+    border-radius: 50%;
+}
+input:checked + .slider {
+    background-color: #2196F3;
+}
+input:checked + .slider:before {
+    transform: translateX(26px);
+}
+.buttons-container {
+    display: flex;
+    flex-wrap: wrap;
+    justify-content: center;
+    align-items: flex-start;
+    padding: 20px;
+    flex-grow: 1;
+    margin-top: 70px;
+}
+.group-selector {
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    width: 100%;
+    margin-bottom: 20px;
+}
+.group-selector select {
+    background-color: var(--bg-color);
+    color: var(--text-color);
+    border: 1px solid var(--button-border);
+    padding: 8px 15px;
+    border-radius: 5px;
+    font-size: 16px;
+    margin: 0 10px;
+}
+.button {
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    width: var(--button-width);
+    height: var(--button-height);
+    margin: 10px;
+    border: 2px solid var(--button-border);
+    border-radius: 10px;
+    font-size: 14px;
+    font-weight: bold;
+    cursor: pointer;
+    text-align: center;
+    text-transform: uppercase;
+    position: relative;
+    transition: all 0.2s ease;
+    overflow: hidden;
+    box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
+}
+.button:active:not(.toggle-button.active) {
+    transform: scale(0.95);
+    opacity: 0.8;
+}
+.button .image-container {
+    position: absolute;
+    width: 100%;
+    height: 100%;
+    overflow: hidden;
+    border-radius: 8px;
+    z-index: 0;
+}
+.button img {
+    width: 100%;
+    height: 100%;
+    object-fit: cover;
+    opacity: 0.6;
+}
+.button .atlas-image {
+    background-repeat: no-repeat;
+    opacity: 0.6;
+}
+.button .text {
+    z-index: 1;
+    position: relative;
+    padding: 8px;
+    text-shadow: 0 0 3px rgba(0, 0, 0, 0.5);
+}
+.toggle-button {
+    border-style: dashed;
+}
+.toggle-button.active {
+    border-style: solid;
+    box-shadow: 0 0 10px rgba(33, 150, 243, 0.8);
+    transform: scale(0.98);
+}
+.settings-button {
+    position: fixed;
+    bottom: 20px;
+    right: 20px;
+    width: 60px;
+    height: 60px;
+    background-color: #2196F3;
+    color: white;
+    border: none;
+    border-radius: 50%;
+    font-size: 24px;
+    cursor: pointer;
+    display: flex;
+    justify-content: center;
+    align-items: center;
+    box-shadow: 0 4px 10px rgba(0, 0, 0, 0.3);
+    z-index: 100;
+}
+.settings-panel {
+    position: fixed;
+    top: 0;
+    right: -300px;
+    width: 300px;
+    height: 100%;
+    background-color: var(--settings-bg);
+    box-shadow: -5px 0 15px rgba(0, 0, 0, 0.2);
+    transition: right 0.3s ease;
+    z-index: 100;
+    overflow-y: auto;
+    padding: 20px;
+    box-sizing: border-box;
+}
+.settings-panel.open {
+    right: 0;
+}
+.settings-title {
+    font-size: 1.5rem;
+    margin-bottom: 20px;
+    display: flex;
+    justify-content: space-between;
+    align-items: center;
+}
+.close-settings {
+    font-size: 1.5rem;
+    cursor: pointer;
+    background: none;
+    border: none;
+    color: var(--text-color);
+}
+.setting-item {
+    margin-bottom: 15px;
+}
+.setting-item label {
+    display: block;
+    margin-bottom: 5px;
+    font-weight: bold;
+}
+.setting-item input, .setting-item select {
+    width: 100%;
+    padding: 8px;
+    border-radius: 5px;
+    border: 1px solid #ccc;
+    background-color: var(--bg-color);
+    color: var(--text-color);
+}
+.theme-setting {
+    display: flex;
+    align-items: center;
+    margin-bottom: 15px;
+}
+.theme-setting-label {
+    margin-right: auto;
+    font-weight: bold;
+}
+.save-settings {
+    background-color: #2196F3;
+    color: white;
+    border: none;
+    padding: 10px 15px;
+    border-radius: 5px;
+    cursor: pointer;
+    width: 100%;
+    margin-top: 15px;
+}
+.btn-manager {
+    background-color: #2196F3;
+    color: white;
+    border: none;
+    padding: 10px 15px;
+    border-radius: 5px;
+    cursor: pointer;
+    width: 100%;
+    margin-top: 15px;
+}
+.latency-overlay {
+    position: fixed;
+    left: 10px;
+    bottom: 10px;
+    padding: 4px 8px;
+    border-radius: 5px;
+    background-color: rgba(0, 0, 0, 0.6);
+    color: #fff;
+    font: 12px monospace;
+    z-index: 100;
+    pointer-events: none;
+}
+.latency-overlay[hidden] {
+    display: none;
+}
+.modal {
+    display: none;
+    position: fixed;
+    z-index: 200;
+    left: 0;
+    top: 0;
+    width: 100%;
+    height: 100%;
+    background-color: rgba(0, 0, 0, 0.7);
+    display: flex;
+    justify-content: center;
+    align-items: center;
+}
+.modal-content {
+    background-color: var(--bg-color);
+    color: var(--text-color);
+    padding: 20px;
+    border-radius: 10px;
+    max-width: 80%;
+    text-align: center;
+}
+.modal-close {
+    background-color: #2196F3;
+    color: white;
+    border: none;
+    padding: 10px 20px;
+    border-radius: 5px;
+    margin-top: 15px;
+    cursor: pointer;
+}
+@media (max-width: 768px) {
+    .button {
+        width: calc(50% - 20px);
+    }
+}
+@media (max-width: 480px) {
+    .button {
+        width: calc(100% - 20px);
+    }
+}
+"""
+
+DECK_JS = """
+document.addEventListener('DOMContentLoaded', () => {
+    const themeSwitch = document.getElementById('theme-switch');
+    const profileSelect = document.getElementById('profile-select');
+    const groupSelect = document.getElementById('group-select');
+    const btnManager = document.getElementById('btn-manager');
+    const managerModal = document.getElementById('manager-modal');
+    const modalClose = document.getElementById('modal-close');
+    themeSwitch.addEventListener('change', () => {
+        const logo = document.querySelector('.logo');
+        if (themeSwitch.checked) {
+            document.body.setAttribute('data-theme', 'light');
+            saveThemePreference('light');
+            if (logo) {
+                logo.src = '/assets/MDLight.png';
+            }
+        } else {
+            document.body.setAttribute('data-theme', 'dark');
+            saveThemePreference('dark');
+            if (logo) {
+                logo.src = '/assets/MDDark.png';
+            }
         }
-        .settings-title {
-            font-size: 1.5rem;
-            margin-bottom: 20px;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
+    });
+    function saveThemePreference(theme) {
+        fetch('/set_theme', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ theme: theme })
+        });
+    }
+    btnManager.addEventListener('click', () => {
+        fetch('/open_button_manager')
+            .then(response => {
+                if (response.ok) {
+                    managerModal.style.display = 'flex';
+                }
+            });
+    });
+    modalClose.addEventListener('click', () => {
+        managerModal.style.display = 'none';
+    });
+    const socketProtocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    const socketUrl = `${socketProtocol}://${window.location.hostname}:${document.body.getAttribute('data-socket-port')}`;
+    let deckSocket = null;
+    let socketSeq = 0;
+    let socketOpened = false;
+    function connectSocket() {
+        const candidate = new WebSocket(socketUrl);
+        candidate.addEventListener('open', () => {
+            deckSocket = candidate;
+            refreshButtonStates();
+            if (socketOpened) {
+                refreshDeck();
+            }
+            socketOpened = true;
+        });
+        candidate.addEventListener('message', event => {
+            const message = JSON.parse(event.data);
+            if (message.type === 'ack' && pendingPresses.has(message.seq)) {
+                recordLatency(pendingPresses.get(message.seq), 'socket');
+                pendingPresses.delete(message.seq);
+            }
+            if (message.type === 'state' || (message.type === 'ack' && message.status === 'conflict')) {
+                applyButtonState(message.id, message.state, message.version);
+            } else if (message.type === 'config') {
+                if (String(message.version) !== configVersion) {
+                    refreshDeck();
+                }
+            } else if (message.type === 'ack' && message.status === 'busy') {
+                console.error("Server is busy, key press was dropped");
+            }
+        });
+        candidate.addEventListener('close', () => {
+            if (deckSocket === candidate) {
+                deckSocket = null;
+                pendingPresses.clear();
+            }
+            setTimeout(connectSocket, 2000);
+        });
+    }
+    let stateVersion = Number(document.body.getAttribute('data-state-version'));
+    const buttonStates = new Map();
+    function applyButtonState(buttonId, state, version) {
+        buttonStates.set(buttonId, state);
+        const target = document.querySelector(`.button[data-id="${buttonId}"]`);
+        if (target) {
+            target.classList.toggle('active', state);
         }
-        .close-settings {
-            font-size: 1.5rem;
-            cursor: pointer;
-            background: none;
-            border: none;
-            color: var(--text-color);
+        if (version > stateVersion) {
+            stateVersion = version;
         }
-        .setting-item {
-            margin-bottom: 15px;
+    }
+    function refreshButtonStates() {
+        fetch(`/button_states?since=${stateVersion}`)
+            .then(response => response.json())
+            .then(data => {
+                Object.entries(data.states).forEach(([buttonId, state]) => {
+                    applyButtonState(buttonId, state);
+                });
+                stateVersion = data.version;
+            });
+    }
+    connectSocket();
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register('/sw.js').catch(error => {
+            console.error('Service worker registration failed:', error);
+        });
+    }
+    function postJson(url, body) {
+        return fetch(url, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(body)
+        });
+    }
+    const pendingPresses = new Map();
+    const latencySamples = [];
+    const recentLatencies = [];
+    const latencyOverlay = document.getElementById('latency-overlay');
+    const latencyOverlaySwitch = document.getElementById('latency-overlay-switch');
+    latencyOverlaySwitch.addEventListener('change', () => {
+        latencyOverlay.hidden = !latencyOverlaySwitch.checked;
+    });
+    function recordLatency(startedAt, transport) {
+        const elapsed = performance.now() - startedAt;
+        latencySamples.push({ ms: Math.round(elapsed * 100) / 100, transport: transport });
+        recentLatencies.push(elapsed);
+        if (recentLatencies.length > 50) {
+            recentLatencies.shift();
         }
-        .setting-item label {
-            display: block;
-            margin-bottom: 5px;
-            font-weight: bold;
+        if (latencySamples.length >= 20) {
+            flushTelemetry();
         }
-        .setting-item input, .setting-item select {
-            width: 100%;
-            padding: 8px;
-            border-radius: 5px;
-            border: 1px solid #ccc;
-            background-color: var(--bg-color);
-            color: var(--text-color);
+        if (!latencyOverlay.hidden) {
+            const sorted = [...recentLatencies].sort((a, b) => a - b);
+            const percentile = fraction => sorted[Math.min(sorted.length - 1, Math.floor(fraction * sorted.length))];
+            latencyOverlay.textContent = `${transport} ${elapsed.toFixed(1)} ms · p50 ${percentile(0.5).toFixed(1)} · p95 ${percentile(0.95).toFixed(1)} · n=${sorted.length}`;
         }
-        .theme-setting {
-            display: flex;
-            align-items: center;
-            margin-bottom: 15px;
+    }
+    function flushTelemetry() {
+        if (!latencySamples.length) {
+            return;
         }
-        .theme-setting-label {
-            margin-right: auto;
-            font-weight: bold;
+        const body = JSON.stringify({ samples: latencySamples.splice(0) });
+        if (navigator.sendBeacon && navigator.sendBeacon('/telemetry', new Blob([body], { type: 'application/json' }))) {
+            return;
         }
-        .save-settings {
-            background-color: #2196F3;
-            color: white;
-            border: none;
-            padding: 10px 15px;
-            border-radius: 5px;
-            cursor: pointer;
-            width: 100%;
-            margin-top: 15px;
+        fetch('/telemetry', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: body,
+            keepalive: true
+        }).catch(() => {});
+    }
+    setInterval(flushTelemetry, 10000);
+    window.addEventListener('pagehide', flushTelemetry);
+    function sendPress(buttonId, isToggle, isActive) {
+        const startedAt = performance.now();
+        if (deckSocket && deckSocket.readyState === WebSocket.OPEN) {
+            const message = { type: 'press', id: buttonId, seq: ++socketSeq };
+            if (isToggle) {
+                message.state = isActive;
+                message.expected = !isActive;
+            }
+            pendingPresses.set(message.seq, startedAt);
+            deckSocket.send(JSON.stringify(message));
+            return;
         }
-        .btn-manager {
-            background-color: #2196F3;
-            color: white;
-            border: none;
-            padding: 10px 15px;
-            border-radius: 5px;
-            cursor: pointer;
-            width: 100%;
-            margin-top: 15px;
+        const stateSaved = isToggle ? postJson('/set_button_state', { id: buttonId, state: isActive, expected: !isActive }) : Promise.resolve(null);
+        stateSaved.then(response => {
+            if (response && response.status === 409) {
+                return response.json().then(data => {
+                    applyButtonState(buttonId, data.state, data.version);
+                    return null;
+                });
+            }
+            return postJson('/trigger', { id: buttonId });
+        }).then(response => {
+            if (!response) {
+                return;
+            }
+            recordLatency(startedAt, 'http');
+            if (!response.ok) {
+                console.error("Failed to send hotkey to server:", response.status, response.statusText);
+            }
+        }).catch(error => {
+            console.error("Error sending hotkey to server:", error);
+        });
+    }
+    function bindButton(button) {
+        const buttonId = button.getAttribute('data-id');
+        const isToggle = button.getAttribute('data-is-toggle') === 'true';
+        button.addEventListener('click', () => {
+            const isActive = isToggle ? button.classList.toggle('active') : false;
+            buttonStates.set(buttonId, isActive);
+            sendPress(buttonId, isToggle, isActive);
+        });
+    }
+    document.querySelectorAll('.button').forEach(bindButton);
+    const buttonsContainer = document.querySelector('.buttons-container');
+    const groupCache = new Map();
+    let configVersion = document.body.getAttribute('data-config-version');
+    let deckTree = null;
+    function groupKey(profile, group) {
+        return `${profile}\u001f${group}`;
+    }
+    function loadDeckTree() {
+        return fetch('/api/deck', { cache: 'no-store' })
+            .then(response => response.json())
+            .then(data => {
+                if (String(data.version) !== configVersion) {
+                    groupCache.clear();
+                    configVersion = String(data.version);
+                }
+                deckTree = data;
+                return data;
+            });
+    }
+    function loadGroup(profile, group) {
+        const key = groupKey(profile, group);
+        if (groupCache.has(key)) {
+            return groupCache.get(key);
         }
-        .modal {
-            display: none;
-            position: fixed;
-            z-index: 200;
-            left: 0;
-            top: 0;
-            width: 100%;
-            height: 100%;
-            background-color: rgba(0, 0, 0, 0.7);
-            display: flex;
-            justify-content: center;
-            align-items: center;
+        const params = new URLSearchParams({ profile: profile, group: group, v: configVersion });
+        const request = fetch(`/api/group?${params}`).then(response => {
+            if (!response.ok) {
+                throw new Error(`Failed to load group: ${response.status}`);
+            }
+            return response.json();
+        });
+        groupCache.set(key, request);
+        request.catch(() => groupCache.delete(key));
+        return request;
+    }
+    function createButton(definition) {
+        const button = document.createElement('div');
+        const state = buttonStates.has(definition.id) ? buttonStates.get(definition.id) : definition.state;
+        button.className = 'button';
+        if (definition.is_toggle) {
+            button.classList.add('toggle-button');
+            button.classList.toggle('active', Boolean(state));
+            button.setAttribute('data-is-toggle', 'true');
         }
-        .modal-content {
-            background-color: var(--bg-color);
-            color: var(--text-color);
-            padding: 20px;
-            border-radius: 10px;
-            max-width: 80%;
-            text-align: center;
+        button.style.backgroundColor = definition.color;
+        button.style.color = definition.text_color;
+        button.setAttribute('data-id', definition.id);
+        if (definition.image) {
+            const imageContainer = document.createElement('div');
+            imageContainer.className = 'image-container';
+            if (definition.atlas) {
+                imageContainer.classList.add('atlas-image');
+                imageContainer.style.backgroundImage = `url('${definition.atlas.url}')`;
+                imageContainer.style.backgroundSize = definition.atlas.size;
+                imageContainer.style.backgroundPosition = definition.atlas.position;
+            } else {
+                const image = document.createElement('img');
+                image.src = definition.image;
+                image.alt = 'Button Image';
+                imageContainer.appendChild(image);
+            }
+            button.appendChild(imageContainer);
         }
-        .modal-close {
-            background-color: #2196F3;
-            color: white;
-            border: none;
-            padding: 10px 20px;
-            border-radius: 5px;
-            margin-top: 15px;
-            cursor: pointer;
+        const text = document.createElement('div');
+        text.className = 'text';
+        text.textContent = definition.text;
+        button.appendChild(text);
+        bindButton(button);
+        return button;
+    }
+    function renderGroup(data) {
+        buttonsContainer.querySelectorAll('.button').forEach(button => button.remove());
+        const fragment = document.createDocumentFragment();
+        data.buttons.forEach(definition => fragment.appendChild(createButton(definition)));
+        buttonsContainer.appendChild(fragment);
+    }
+    function renderGroupOptions(profile, activeGroup) {
+        const profileEntry = deckTree.profiles.find(entry => entry.name === profile);
+        groupSelect.replaceChildren(...profileEntry.groups.map(name => new Option(name, name, false, name === activeGroup)));
+    }
+    function prefetchNeighbours(profile, group) {
+        const profileEntry = deckTree && deckTree.profiles.find(entry => entry.name === profile);
+        if (!profileEntry) {
+            return;
         }
-        @media (max-width: 768px) {
-            .button {
-                width: calc(50% - 20px);
+        const index = profileEntry.groups.indexOf(group);
+        [index - 1, index + 1].forEach(neighbour => {
+            if (neighbour >= 0 && neighbour < profileEntry.groups.length) {
+                loadGroup(profile, profileEntry.groups[neighbour]).catch(() => {});
+            }
+        });
+    }
+    function selectGroup(profile, group, fallbackUrl) {
+        loadGroup(profile, group).then(data => {
+            renderGroup(data);
+            profileSelect.value = profile;
+            groupSelect.value = group;
+            postJson('/api/select', { profile: profile, group: group });
+            prefetchNeighbours(profile, group);
+        }).catch(() => {
+            window.location.href = fallbackUrl;
+        });
+    }
+    profileSelect.addEventListener('change', () => {
+        const profile = profileSelect.value;
+        const treeReady = deckTree ? Promise.resolve(deckTree) : loadDeckTree();
+        treeReady.then(() => {
+            const profileEntry = deckTree.profiles.find(entry => entry.name === profile);
+            const group = profileEntry.groups[0];
+            renderGroupOptions(profile, group);
+            selectGroup(profile, group, `/set_profile/${encodeURIComponent(profile)}`);
+        }).catch(() => {
+            window.location.href = `/set_profile/${encodeURIComponent(profile)}`;
+        });
+    });
+    groupSelect.addEventListener('change', () => {
+        selectGroup(profileSelect.value, groupSelect.value, `/set_group/${encodeURIComponent(groupSelect.value)}`);
+    });
+    function refreshDeck() {
+        const previousVersion = configVersion;
+        loadDeckTree().then(tree => {
+            if (String(tree.version) === previousVersion) {
+                return;
             }
+            const profile = profileSelect.value;
+            const group = groupSelect.value;
+            const profileEntry = tree.profiles.find(entry => entry.name === profile);
+            if (!profileEntry || !profileEntry.groups.includes(group)) {
+                window.location.reload();
+                return;
+            }
+            profileSelect.replaceChildren(...tree.profiles.map(entry => new Option(entry.name, entry.name, false, entry.name === profile)));
+            renderGroupOptions(profile, group);
+            return loadGroup(profile, group).then(renderGroup);
+        }).catch(() => {});
+    }
+    const pageConfigVersion = configVersion;
+    loadDeckTree().then(tree => {
+        if (tree.active_profile !== profileSelect.value || tree.active_group !== groupSelect.value || String(tree.version) !== pageConfigVersion) {
+            profileSelect.replaceChildren(...tree.profiles.map(entry => new Option(entry.name, entry.name, false, entry.name === tree.active_profile)));
+            renderGroupOptions(tree.active_profile, tree.active_group);
+            selectGroup(tree.active_profile, tree.active_group, '/');
+            return;
         }
-        @media (max-width: 480px) {
-            .button {
-                width: calc(100% - 20px);
+        prefetchNeighbours(profileSelect.value, groupSelect.value);
+    }).catch(() => {});
+    const settingsButton = document.getElementById('settings-button');
+    const settingsPanel = document.getElementById('settings-panel');
+    const closeSettings = document.getElementById('close-settings');
+    const saveSettings = document.getElementById('save-settings');
+    settingsButton.addEventListener('click', () => {
+        settingsPanel.classList.add('open');
+    });
+    closeSettings.addEventListener('click', () => {
+        settingsPanel.classList.remove('open');
+    });
+    saveSettings.addEventListener('click', () => {
+        const buttonsPerRow = document.getElementById('buttons-per-row').value;
+        const buttonHeight = document.getElementById('button-height').value;
+        const buttonWidth = document.getElementById('button-width').value;
+        fetch('/save_settings', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                buttons_per_row: buttonsPerRow,
+                button_height: buttonHeight,
+                button_width: buttonWidth,
+                latency_overlay: latencyOverlaySwitch.checked
+            })
+        }).then(response => {
+            if (response.ok) {
+                window.location.reload();
+            } else {
+                console.error("Failed to save settings");
             }
+        });
+    });
+});
+"""
+
+HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>MobileDeck</title>
+    <link rel="stylesheet" href="/bundles/{{ bundles.css }}">
+    <style>
+        :root {
+            --button-width: {{ button_width }}px;
+            --button-height: {{ button_height }}px;
         }
     </style>
+    <script src="/bundles/{{ bundles.js }}" defer></script>
 </head>
-<body data-theme="{{ theme }}">
+<body data-theme="{{ theme }}" data-socket-port="{{ socket_port }}" data-state-version="{{ state_version }}" data-config-version="{{ config_version }}">
     <div class="header">
         <img class="logo" src="/assets/{{ 'MDLight.png' if theme == 'light' else 'MDDark.png' }}" alt="MobileDeck Logo">
     </div>
@@ -1127,21 +3162,24 @@ HTML_TEMPLATE = """
             </select>
         </div>
         {% for button in buttons %}
-        <div class="button{% if button.get('is_toggle', False) %} toggle-button{% endif %}" 
+        <div class="button{% if button.get('is_toggle', False) %} toggle-button{% if toggle_states.get(button['id']) %} active{% endif %}{% endif %}" 
              style="background-color: {{ button['color'] }}; color: {{ button['text_color'] }};" 
-             data-hotkey='{{ button["hotkey"]|tojson }}'
-             {% if button.get('sequence', False) %}data-sequence='{{ button["sequence"]|tojson }}'{% endif %}
-             data-id="{{ loop.index0 }}"
+             data-id="{{ button['id'] }}"
              {% if button.get('is_toggle', False) %}data-is-toggle="true"{% endif %}>
             {% if button['image'] %}
+            {% if atlas and button['id'] in atlas.positions %}
+            <div class="image-container atlas-image" style="background-image: url('{{ atlas.url }}'); background-size: {{ atlas.size }}; background-position: {{ atlas.positions[button['id']] }};"></div>
+            {% else %}
             <div class="image-container">
-                <img src="{{ button['image'] }}" alt="Button Image">
+                <img src="{{ image_src(button['image']) }}" alt="Button Image">
             </div>
             {% endif %}
+            {% endif %}
             <div class="text">{{ button['text'] }}</div>
         </div>
         {% endfor %}
     </div>
+    <div class="latency-overlay" id="latency-overlay" {% if not latency_overlay %}hidden{% endif %}>Tap a button to measure latency</div>
     <button class="settings-button" id="settings-button">⚙️</button>
     <div class="settings-panel" id="settings-panel">
         <div class="settings-title">
@@ -1167,6 +3205,13 @@ HTML_TEMPLATE = """
             <label for="button-width">Button Width (px)</label>
             <input type="number" id="button-width" min="50" max="400" value="{{ button_width }}">
         </div>
+        <div class="theme-setting">
+            <span class="theme-setting-label">Latency Overlay</span>
+            <label class="theme-toggle">
+                <input type="checkbox" id="latency-overlay-switch" {% if latency_overlay %}checked{% endif %}>
+                <span class="slider"></span>
+            </label>
+        </div>
         <button class="save-settings" id="save-settings">Save Settings</button>
         <button class="btn-manager" id="btn-manager">Button Management</button>
     </div>
@@ -1178,165 +3223,196 @@ HTML_TEMPLATE = """
             <button class="modal-close" id="modal-close">Close</button>
         </div>
     </div>
-    <script>
-        document.addEventListener('DOMContentLoaded', () => {
-            const themeSwitch = document.getElementById('theme-switch');
-            const profileSelect = document.getElementById('profile-select');
-            const groupSelect = document.getElementById('group-select');
-            const btnManager = document.getElementById('btn-manager');
-            const managerModal = document.getElementById('manager-modal');
-            const modalClose = document.getElementById('modal-close');
-            themeSwitch.addEventListener('change', () => {
-                const logo = document.querySelector('.logo');
-                if (themeSwitch.checked) {
-                    document.body.setAttribute('data-theme', 'light');
-                    saveThemePreference('light');
-                    if (logo) {
-                        logo.src = '/assets/MDLight.png';
-                    }
-                } else {
-                    document.body.setAttribute('data-theme', 'dark');
-                    saveThemePreference('dark');
-                    if (logo) {
-                        logo.src = '/assets/MDDark.png';
-                    }
-                }
-            });
-            function saveThemePreference(theme) {
-                fetch('/set_theme', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({ theme: theme })
-                });
-            }
-            profileSelect.addEventListener('change', () => {
-                window.location.href = `/set_profile/${profileSelect.value}`;
-            });
-            groupSelect.addEventListener('change', () => {
-                window.location.href = `/set_group/${groupSelect.value}`;
-            });
-            btnManager.addEventListener('click', () => {
-                fetch('/open_button_manager')
-                    .then(response => {
-                        if (response.ok) {
-                            managerModal.style.display = 'flex';
-                        }
-                    });
-            });
-            modalClose.addEventListener('click', () => {
-                managerModal.style.display = 'none';
-            });
-            const buttons = document.querySelectorAll('.button');
-            buttons.forEach(button => {
-                const buttonId = button.getAttribute('data-id');
-                const isToggle = button.getAttribute('data-is-toggle') === 'true';
-                if (isToggle) {
-                    fetch(`/get_button_state/${buttonId}`)
-                        .then(response => response.json())
-                        .then(data => {
-                            if (data.state) {
-                                button.classList.add('active');
-                            }
-                        });
-                }
-                button.addEventListener('click', () => {
-                    const hotkey = JSON.parse(button.getAttribute('data-hotkey') || '[]');
-                    const sequence = JSON.parse(button.getAttribute('data-sequence') || 'null');
-                    const isToggle = button.getAttribute('data-is-toggle') === 'true';
-                    const buttonId = button.getAttribute('data-id');
-                    if (isToggle) {
-                        const isActive = button.classList.toggle('active');
-                        fetch('/set_button_state', {
-                            method: 'POST',
-                            headers: {
-                                'Content-Type': 'application/json',
-                            },
-                            body: JSON.stringify({ 
-                                id: buttonId,
-                                state: isActive
-                            })
-                        });
-                    }
-                    fetch('/trigger', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify({ 
-                            hotkey: hotkey,
-                            sequence: sequence,
-                            toggle: isToggle,
-                            id: buttonId
-                        })
-                    }).then(response => {
-                        if (!response.ok) {
-                            console.error("Failed to send hotkey to server:", response.status, response.statusText);
-                        }
-                    }).catch(error => {
-                        console.error("Error sending hotkey to server:", error);
-                    });
-                });
-            });
-            const settingsButton = document.getElementById('settings-button');
-            const settingsPanel = document.getElementById('settings-panel');
-            const closeSettings = document.getElementById('close-settings');
-            const saveSettings = document.getElementById('save-settings');
-            settingsButton.addEventListener('click', () => {
-                settingsPanel.classList.add('open');
-            });
-            closeSettings.addEventListener('click', () => {
-                settingsPanel.classList.remove('open');
-            });
-            saveSettings.addEventListener('click', () => {
-                const buttonsPerRow = document.getElementById('buttons-per-row').value;
-                const buttonHeight = document.getElementById('button-height').value;
-                const buttonWidth = document.getElementById('button-width').value;
-                fetch('/save_settings', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({
-                        buttons_per_row: buttonsPerRow,
-                        button_height: buttonHeight,
-                        button_width: buttonWidth
-                    })
-                }).then(response => {
-                    if (response.ok) {
-                        window.location.reload();
-                    } else {
-                        console.error("Failed to save settings");
-                    }
-                });
-            });
-        });
-    </script>
 </body>
 </html>
 """
 
+class StaticBundle:
+    def __init__(self, name, extension, mimetype, content):
+        self.body = content.encode('utf-8')
+        self.digest = hashlib.sha256(self.body).hexdigest()[:16]
+        self.filename = f"{name}.{self.digest}.{extension}"
+        self.mimetype = mimetype
+        self.variants = {'gzip': gzip.compress(self.body, 9), 'identity': self.body}
+        if brotli is not None:
+            self.variants = {'br': brotli.compress(self.body), **self.variants}
+
+    def etag(self, encoding):
+        return self.digest if encoding == 'identity' else f"{self.digest}-{encoding}"
+
+static_bundles = {}
+
+def register_bundle(name, extension, mimetype, content):
+    bundle = StaticBundle(name, extension, mimetype, content)
+    static_bundles[bundle.filename] = bundle
+    return bundle.filename
+
+deck_bundles = {
+    'css': register_bundle('deck', 'css', 'text/css', DECK_CSS),
+    'js': register_bundle('deck', 'js', 'text/javascript', DECK_JS)
+}
+deck_template = app.jinja_env.from_string(HTML_TEMPLATE)
+mark_startup('bundles')
+
+SERVICE_WORKER_JS = """
+const CACHE_NAME = 'mobiledeck-__CACHE_VERSION__';
+const PRECACHE_URLS = __PRECACHE_URLS__;
+const REVALIDATED_PATHS = ['/', '/api/deck', '/api/group'];
+const IMMUTABLE_PREFIXES = ['/bundles/', '/images/', '/assets/'];
+
+self.addEventListener('install', event => {
+    event.waitUntil(
+        caches.open(CACHE_NAME)
+            .then(cache => cache.addAll(PRECACHE_URLS))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', event => {
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(
+                names.filter(name => name.startsWith('mobiledeck-') && name !== CACHE_NAME)
+                    .map(name => caches.delete(name))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+function staleWhileRevalidate(event) {
+    return caches.open(CACHE_NAME).then(cache => cache.match(event.request).then(cached => {
+        const network = fetch(event.request).then(response => {
+            if (response.ok) {
+                cache.put(event.request, response.clone());
+            }
+            return response;
+        });
+        if (cached) {
+            event.waitUntil(network.catch(() => {}));
+            return cached;
+        }
+        return network;
+    }));
+}
+
+function cacheFirst(event) {
+    return caches.open(CACHE_NAME).then(cache => cache.match(event.request).then(cached => {
+        if (cached) {
+            return cached;
+        }
+        return fetch(event.request).then(response => {
+            if (response.ok) {
+                cache.put(event.request, response.clone());
+            }
+            return response;
+        });
+    }));
+}
+
+self.addEventListener('fetch', event => {
+    const url = new URL(event.request.url);
+    if (event.request.method !== 'GET' || event.request.cache === 'no-store' || url.origin !== self.location.origin) {
+        return;
+    }
+    if (REVALIDATED_PATHS.includes(url.pathname)) {
+        event.respondWith(staleWhileRevalidate(event));
+    } else if (IMMUTABLE_PREFIXES.some(prefix => url.pathname.startsWith(prefix))) {
+        event.respondWith(cacheFirst(event));
+    }
+});
+"""
+
+def service_worker_version():
+    digest = hashlib.sha256()
+    digest.update((saved_config_text or '').encode('utf-8'))
+    for filename in sorted(static_bundles):
+        digest.update(filename.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+MAX_TELEMETRY_BATCH = 100
+TELEMETRY_TRANSPORTS = ('socket', 'http')
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+class LatencyTelemetry:
+    def __init__(self, max_samples=512, max_devices=256):
+        self.max_samples = max_samples
+        self.max_devices = max_devices
+        self.devices = OrderedDict()
+        self.lock = threading.Lock()
+
+    def record(self, token, samples, agent=""):
+        accepted = []
+        for sample in samples:
+            if not isinstance(sample, dict) or sample.get('transport') not in TELEMETRY_TRANSPORTS:
+                continue
+            ms = sample.get('ms')
+            if isinstance(ms, (int, float)) and 0 <= ms < 600000:
+                accepted.append((sample['transport'], float(ms)))
+        with self.lock:
+            device = self.devices.pop(token, None)
+            if device is None:
+                device = {"samples": deque(maxlen=self.max_samples), "count": 0}
+            device["agent"] = agent
+            device["count"] += len(accepted)
+            device["samples"].extend(accepted)
+            self.devices[token] = device
+            while len(self.devices) > self.max_devices:
+                self.devices.popitem(last=False)
+
+    def summary(self):
+        with self.lock:
+            devices = [(token, device["agent"], device["count"], list(device["samples"])) for token, device in self.devices.items()]
+        result = {}
+        for token, agent, count, samples in devices:
+            transports = {}
+            for transport in TELEMETRY_TRANSPORTS:
+                values = sorted(ms for sample_transport, ms in samples if sample_transport == transport)
+                if values:
+                    transports[transport] = {
+                        "samples": len(values),
+                        "p50": round(percentile(values, 0.5), 2),
+                        "p90": round(percentile(values, 0.9), 2),
+                        "p99": round(percentile(values, 0.99), 2),
+                        "max": round(values[-1], 2)
+                    }
+            result[token[:8]] = {"agent": agent, "total_samples": count, "tap_to_ack_ms": transports}
+        return result
+
+latency_telemetry = LatencyTelemetry()
+
+@app.after_request
+def remember_device(response):
+    token = g.get('new_device_token')
+    if token is not None:
+        response.set_cookie(DEVICE_COOKIE, token, max_age=DEVICE_COOKIE_MAX_AGE, httponly=True, samesite='Lax')
+    return response
+
 @app.route('/')
 def index():
-    theme = session.get('theme', 'dark')
-    buttons_per_row = session.get('buttons_per_row', 3)
-    button_height = session.get('button_height', 100)
-    button_width = session.get('button_width', 120)
-    active_profile = getattr(config, 'active_profile', 'Default')
-    active_group = getattr(config, 'active_group', 'Main')
-    active_groups = []
-    buttons = []
-    for profile in config.profiles:
-        if profile['name'] == active_profile:
-            active_groups = profile['groups']
-            for group in profile['groups']:
-                if group['name'] == active_group:
-                    buttons = group['buttons']
-                    break
-            break
-    return render_template_string(
-        HTML_TEMPLATE, 
+    client = current_client()
+    theme = client['theme']
+    buttons_per_row = client['buttons_per_row']
+    button_height = client['button_height']
+    button_width = client['button_width']
+    latency_overlay = client['latency_overlay']
+    active_profile, active_group = client_selection(client)
+    group = config.get_group(active_profile, active_group)
+    buttons = group['buttons'] if group else []
+    state_version = button_states.version
+    toggle_states = get_toggle_states(buttons)
+    cache_key = (config.version, active_profile, active_group, theme, buttons_per_row, button_height, button_width, latency_overlay, tuple(toggle_states.items()))
+    page = page_cache.get(cache_key)
+    if page is not None:
+        return page[0] + str(state_version) + page[2]
+    profile = config.get_profile(active_profile)
+    active_groups = profile['groups'] if profile else []
+    atlas = None
+    if config.default_preferences.get('image_atlas'):
+        atlas = image_cache.atlas_for(active_profile, active_group, buttons, button_width, button_height)
+    page = render_template(
+        deck_template,
         buttons=buttons,
         profiles=config.profiles,
         active_profile=active_profile,
@@ -1345,94 +3421,212 @@ def index():
         theme=theme,
         buttons_per_row=buttons_per_row,
         button_height=button_height,
-        button_width=button_width
+        button_width=button_width,
+        latency_overlay=latency_overlay,
+        toggle_states=toggle_states,
+        state_version=STATE_VERSION_MARKER,
+        config_version=config.version,
+        bundles=deck_bundles,
+        socket_port=SOCKET_PORT,
+        image_src=lambda source: image_cache.url_for(source, button_width, button_height),
+        atlas=atlas
     )
+    if len(page_cache) >= PAGE_CACHE_SIZE:
+        page_cache.clear()
+    page_cache[cache_key] = page.partition(STATE_VERSION_MARKER)
+    return page.replace(STATE_VERSION_MARKER, str(state_version), 1)
+
+def button_payload(button, button_width, button_height, atlas):
+    payload = {
+        'id': button['id'],
+        'text': button['text'],
+        'color': button['color'],
+        'text_color': button['text_color'],
+        'image': image_cache.url_for(button['image'], button_width, button_height),
+        'is_toggle': button.get('is_toggle', False),
+        'state': button_states.get(button['id'], False)
+    }
+    if atlas and button['id'] in atlas['positions']:
+        payload['atlas'] = {'url': atlas['url'], 'size': atlas['size'], 'position': atlas['positions'][button['id']]}
+    return payload
+
+@app.route('/api/deck')
+def api_deck():
+    active_profile, active_group = client_selection(current_client())
+    return jsonify({
+        'version': config.version,
+        'active_profile': active_profile,
+        'active_group': active_group,
+        'profiles': [
+            {'name': profile['name'], 'groups': [group['name'] for group in profile['groups']]}
+            for profile in config.profiles
+        ]
+    })
+
+@app.route('/api/group')
+def api_group():
+    profile_name = request.args.get('profile', '')
+    group_name = request.args.get('group', '')
+    group = config.get_group(profile_name, group_name)
+    if group is None:
+        return 'Not Found', 404
+    client = current_client()
+    button_height = client['button_height']
+    button_width = client['button_width']
+    atlas = None
+    if config.default_preferences.get('image_atlas'):
+        atlas = image_cache.atlas_for(profile_name, group_name, group['buttons'], button_width, button_height)
+    return jsonify({
+        'version': config.version,
+        'state_version': button_states.version,
+        'profile': profile_name,
+        'group': group_name,
+        'buttons': [button_payload(button, button_width, button_height, atlas) for button in group['buttons']]
+    })
+
+@app.route('/api/select', methods=['POST'])
+def api_select():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return 'Bad Request', 400
+    profile_name = data.get('profile')
+    group_name = data.get('group')
+    if not isinstance(profile_name, str) or not isinstance(group_name, str):
+        return 'Bad Request', 400
+    if config.get_group(profile_name, group_name) is None:
+        return 'Not Found', 404
+    clients.update(device_token(), active_profile=profile_name, active_group=group_name)
+    return '', 204
+
+@app.route('/bundles/<filename>')
+def serve_bundle(filename):
+    bundle = static_bundles.get(filename)
+    if bundle is None:
+        return 'Not Found', 404
+    encoding = request.accept_encodings.best_match(list(bundle.variants), default='identity')
+    if any(request.if_none_match.contains(bundle.etag(variant)) for variant in bundle.variants):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(bundle.variants[encoding], mimetype=bundle.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(bundle.etag(encoding))
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.route('/sw.js')
+def serve_service_worker():
+    precache_urls = ['/', '/api/deck', '/assets/MDDark.png', '/assets/MDLight.png']
+    precache_urls += [f"/bundles/{filename}" for filename in deck_bundles.values()]
+    script = SERVICE_WORKER_JS.replace('__CACHE_VERSION__', service_worker_version())
+    script = script.replace('__PRECACHE_URLS__', json.dumps(precache_urls))
+    response = app.response_class(script, mimetype='text/javascript')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/images/<filename>')
+def serve_image(filename):
+    path = image_cache.path_for(os.path.basename(filename))
+    if path is None:
+        return 'Not Found', 404
+    return send_from_directory(image_cache.directory, os.path.basename(path), max_age=31536000)
 
 @app.route('/assets/<path:filename>')
 def serve_assets(filename):
-    return send_from_directory('assets', filename)
+    return send_from_directory('assets', filename, max_age=86400)
 
 @app.route('/set_theme', methods=['POST'])
 def set_theme():
-    data = request.get_json()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or data.get('theme', 'dark') not in ('dark', 'light'):
+        return 'Bad Request', 400
     theme = data.get('theme', 'dark')
-    session['theme'] = theme
+    clients.update(device_token(), theme=theme)
     return '', 204
 
 @app.route('/set_profile/<profile_name>')
 def set_profile(profile_name):
-    for profile in config.profiles:
-        if profile['name'] == profile_name:
-            config.active_profile = profile_name
-            config.active_group = profile['groups'][0]['name']
-            config_data = {
-                "profiles": config.profiles,
-                "default_preferences": config.default_preferences,
-                "active_profile": profile_name,
-                "active_group": profile['groups'][0]['name']
-            }
-            save_config(config_data)
-            break
+    profile = config.get_profile(profile_name)
+    if profile:
+        clients.update(device_token(), active_profile=profile_name, active_group=profile['groups'][0]['name'])
     return redirect(url_for('index'))
 
 @app.route('/set_group/<group_name>')
 def set_group(group_name):
-    active_profile = config.active_profile
-    for profile in config.profiles:
-        if profile['name'] == active_profile:
-            for group in profile['groups']:
-                if group['name'] == group_name:
-                    config.active_group = group_name
-                    config_data = {
-                        "profiles": config.profiles,
-                        "default_preferences": config.default_preferences,
-                        "active_profile": active_profile,
-                        "active_group": group_name
-                    }
-                    save_config(config_data)
-                    break
+    active_profile, active_group = client_selection(current_client())
+    if config.get_group(active_profile, group_name):
+        clients.update(device_token(), active_profile=active_profile, active_group=group_name)
     return redirect(url_for('index'))
 
 @app.route('/trigger', methods=['POST'])
 def trigger():
-    data = request.get_json()
-    if not data:
+    received_at = time.perf_counter()
+    data = request.get_json(silent=True)
+    metrics.observe('parse', time.perf_counter() - received_at)
+    if not isinstance(data, dict) or not isinstance(data.get('id'), str):
         return 'Bad Request', 400
-    hotkey = data.get('hotkey', [])
-    sequence = data.get('sequence', None)
-    is_toggle = data.get('toggle', False)
-    button_id = data.get('id')
-    try:
-        if is_toggle and not button_states.get(button_id, False):
-            return '', 204
-        if hotkey:
-            for key in hotkey:
-                key_to_press = getattr(Key, key, key) if hasattr(Key, key) else key
-                keyboard.press(key_to_press)
-            for key in reversed(hotkey):
-                key_to_press = getattr(Key, key, key) if hasattr(Key, key) else key
-                keyboard.release(key_to_press)
-        if sequence:
-            for step in sequence:
-                for key in step:
-                    key_to_press = getattr(Key, key, key) if hasattr(Key, key) else key
-                    keyboard.press(key_to_press)
-                for key in reversed(step):
-                    key_to_press = getattr(Key, key, key) if hasattr(Key, key) else key
-                    keyboard.release(key_to_press)
-    except Exception as e:
-        print(f"Error while processing keys: {e}")
-        return 'Error', 500
-    return '', 204
+    status, job = trigger_button(data['id'], received_at)
+    if status == 'not_found':
+        return 'Not Found', 404
+    if status == 'inactive':
+        return '', 204
+    if status == 'busy':
+        return 'Too Many Requests', 429
+    return jsonify({'job': job['id']}), 202
+
+@app.route('/jobs/<int:job_id>')
+def get_job(job_id):
+    job = injector.get_job(job_id)
+    if job is None:
+        return 'Not Found', 404
+    return jsonify(job)
+
+@app.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = injector.cancel(job_id)
+    if job is None:
+        return 'Not Found', 404
+    return jsonify(job)
+
+@app.route('/metrics')
+def serve_metrics():
+    stats = injector.stats()
+    with deck_sockets_lock:
+        connected = len(deck_sockets)
+    gauges = (
+        ("queue_depth", "Key jobs waiting for the injector.", stats["depth"]),
+        ("queue_capacity", "Maximum number of queued key jobs.", stats["capacity"]),
+        ("sockets_connected", "Decks connected over WebSocket.", connected)
+    )
+    return app.response_class(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+@app.route('/injector')
+def injector_stats():
+    return jsonify(injector.stats())
 
 @app.route('/set_button_state', methods=['POST'])
 def set_button_state():
-    data = request.get_json()
-    button_id = data.get('id')
-    state = data.get('state', False)
-    if button_id is not None:
-        button_states[button_id] = state
-    return '', 204
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('id'), str):
+        return 'Bad Request', 400
+    button_id = data['id']
+    state = bool(data.get('state', False))
+    changed, version = update_button_state(button_id, state, expected=data.get('expected'))
+    if not changed:
+        return jsonify({'state': button_states.get(button_id), 'version': version}), 409
+    return jsonify({'state': state, 'version': version})
+
+@app.route('/button_states')
+def get_button_states():
+    since = request.args.get('since', type=int)
+    if since is not None:
+        version, changes = button_states.changes_since(since)
+        if changes is not None:
+            return jsonify({'version': version, 'states': changes, 'full': False})
+    version = button_states.version
+    group = config.get_group(*client_selection(current_client()))
+    return jsonify({'version': version, 'states': get_toggle_states(group['buttons'] if group else []), 'full': True})
 
 @app.route('/get_button_state/<button_id>')
 def get_button_state(button_id):
@@ -1441,34 +3635,89 @@ def get_button_state(button_id):
 
 @app.route('/save_settings', methods=['POST'])
 def save_settings():
-    data = request.get_json()
-    buttons_per_row = int(data.get('buttons_per_row', 3))
-    button_height = int(data.get('button_height', 100))
-    button_width = int(data.get('button_width', 120))
-    session['buttons_per_row'] = buttons_per_row
-    session['button_height'] = button_height
-    session['button_width'] = button_width
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return 'Bad Request', 400
+    settings = {}
+    for name in CLIENT_SETTING_LIMITS:
+        value = data.get(name, DEFAULT_CLIENT_SETTINGS[name])
+        if isinstance(value, bool) or not isinstance(value, (int, str)):
+            return 'Bad Request', 400
+        try:
+            settings[name] = clamp_setting(name, int(value))
+        except ValueError:
+            return 'Bad Request', 400
+    clients.update(device_token(), latency_overlay=bool(data.get('latency_overlay', False)), **settings)
+    return '', 204
+
+@app.route('/telemetry', methods=['GET', 'POST'])
+def telemetry():
+    if request.method == 'GET':
+        return jsonify(latency_telemetry.summary())
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('samples'), list):
+        return 'Bad Request', 400
+    latency_telemetry.record(device_token(), data['samples'][:MAX_TELEMETRY_BATCH], request.user_agent.string)
     return '', 204
 
 @app.route('/open_button_manager')
 def open_button_manager():
-    thread = threading.Thread(target=start_button_manager)
-    thread.daemon = True
-    thread.start()
+    gui.open_manager()
     return '', 204
 
+def print_startup_report():
+    print("Startup phases:")
+    previous = startup_started
+    for phase, finished in startup_phases:
+        print(f"  {phase:<16}{(finished - previous) * 1000:10.1f} ms")
+        previous = finished
+    print(f"  {'total':<16}{(previous - startup_started) * 1000:10.1f} ms")
+    if getattr(sys, 'frozen', False):
+        print("Import timings are not available in frozen builds")
+        return
+    module_name = os.path.splitext(os.path.basename(__file__))[0]
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module_name}'],
+        cwd=get_script_directory(), capture_output=True, text=True
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        imports.append((int(fields[1]), int(fields[0]), fields[2].strip()))
+    if not imports:
+        print("Could not collect import timings")
+        return
+    print("Slowest imports (cumulative / self):")
+    for cumulative, own, name in sorted(imports, reverse=True)[:20]:
+        print(f"  {cumulative / 1000:10.1f} ms {own / 1000:10.1f} ms  {name}")
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="MobileDeck server")
+    parser.add_argument('--production', action='store_true', help="serve with the multi-threaded production server instead of the Flask debug server")
+    parser.add_argument('--threads', type=int, default=8, help="worker threads for the production server")
+    parser.add_argument('--timeout', type=float, default=30.0, help="seconds a connection may stay idle before it is closed")
+    parser.add_argument('--profile-startup', action='store_true', help="print how long each startup phase and import took, then exit")
+    parser.add_argument('--key-backend', choices=KEY_BACKENDS, default=key_backend_name if key_backend_name in KEY_BACKENDS else 'pynput', help="where key presses go: pynput sends them to the OS, record and null only log or drop them")
+    args = parser.parse_args()
     if not os.path.exists('data'):
         os.makedirs('data')
     if not os.path.exists('assets'):
         os.makedirs('assets')
         print("Created 'assets' directory. Please place MDDark.png and MDLight.png files there.")
-    config = load_config()
-    for profile in config.profiles:
-        if profile["name"] == config.active_profile:
-            for group in profile["groups"]:
-                if group["name"] == config.active_group:
-                    for i, button in enumerate(group["buttons"]):
-                        if button.get('is_toggle', False):
-                            button_states[str(i)] = False
-    app.run(host='0.0.0.0', port=23843, debug=True)
\ No newline at end of file
+    mark_startup('main')
+    if args.profile_startup:
+        print_startup_report()
+        sys.exit(0)
+    set_key_backend(args.key_backend)
+    injector.start()
+    if args.production:
+        serve_production('0.0.0.0', SERVER_PORT, args.threads, args.timeout)
+    else:
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_socket_server(SOCKET_PORT)
+            config_watcher.start()
+        app.run(host='0.0.0.0', port=SERVER_PORT, debug=True)
\ No newline at end of file
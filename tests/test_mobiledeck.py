@@ -0,0 +1,195 @@
+import io
+import os
+import struct
+import sys
+import tempfile
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+os.environ['MOBILEDECK_DATA_DIR'] = tempfile.mkdtemp(prefix='mobiledeck-test-')
+os.environ['MOBILEDECK_KEY_BACKEND'] = 'record'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mobiledeck
+
+class FakeConnection:
+    def __init__(self):
+        self.sent = b''
+
+    def sendall(self, data):
+        self.sent += data
+
+def client_frame(payload, opcode=0x1, final=True, mask=b'\x01\x02\x03\x04'):
+    header = bytearray([(0x80 if final else 0) | opcode])
+    length = len(payload)
+    if length < 126:
+        header.append(0x80 | length)
+    elif length < 65536:
+        header.append(0x80 | 126)
+        header += struct.pack('!H', length)
+    else:
+        header.append(0x80 | 127)
+        header += struct.pack('!Q', length)
+    return bytes(header) + mask + bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+def deck_socket(data):
+    return mobiledeck.DeckSocket(FakeConnection(), io.BytesIO(data))
+
+def test_receive_decodes_masked_text_frames():
+    assert deck_socket(client_frame(b'{"type": "press"}')).receive() == '{"type": "press"}'
+
+def test_receive_decodes_extended_lengths():
+    payload = b'x' * 300
+    assert deck_socket(client_frame(payload)).receive() == payload.decode()
+
+def test_receive_joins_fragments_and_answers_pings():
+    data = client_frame(b'hel', final=False) + client_frame(b'ping', opcode=0x9) + client_frame(b'lo', opcode=0x0)
+    socket = deck_socket(data)
+    assert socket.receive() == 'hello'
+    assert socket.connection.sent == bytes([0x8A, 4]) + b'ping'
+
+def test_receive_returns_none_on_close():
+    assert deck_socket(client_frame(b'', opcode=0x8)).receive() is None
+
+def test_receive_rejects_unmasked_and_oversized_frames():
+    with pytest.raises(ConnectionError):
+        deck_socket(bytes([0x81, 0x02]) + b'hi').receive()
+    with pytest.raises(ConnectionError):
+        deck_socket(client_frame(b'x' * (mobiledeck.MAX_FRAME_SIZE + 1))).receive()
+    with pytest.raises(ConnectionError):
+        deck_socket(client_frame(b'partial')[:-2]).receive()
+
+def config_with_button(button):
+    return {"profiles": [{"name": "P", "groups": [{"name": "G", "buttons": [button]}]}]}
+
+def test_validate_config_fills_defaults():
+    deck = mobiledeck.validate_config({})
+    assert deck.get_group("Default", "Main") == {"name": "Main", "buttons": []}
+    assert deck.default_preferences == mobiledeck.DEFAULT_PREFERENCES
+    deck = mobiledeck.validate_config(config_with_button({"text": "Copy", "hotkey": ["ctrl", "c"]}))
+    button = deck.get_group("P", "G")["buttons"][0]
+    assert button["is_toggle"] is False and button["image"] is None
+    assert deck.get_button(button["id"]) is button
+
+@pytest.mark.parametrize("data", [
+    [],
+    {"profiles": "oops"},
+    {"profiles": ["x"]},
+    {"profiles": [{"name": ""}]},
+    {"profiles": [{"name": "P", "groups": [{"buttons": []}]}]},
+    {"profiles": [{"name": "P", "groups": [{"name": "G", "buttons": {}}]}]},
+    config_with_button({"hotkey": [1]}),
+    config_with_button({"hotkey": "ctrl"}),
+    config_with_button({"is_toggle": "yes"}),
+    config_with_button({"text": 5}),
+    config_with_button({"sequence": [["a", 2]]}),
+    config_with_button({"sequence": [{"keys": ["a"], "unknown": 1}]}),
+    config_with_button({"sequence": [{"delay": -1}]}),
+    config_with_button({"sequence": [{"repeat": True}]}),
+    {"default_preferences": {"buttons_per_row": "3"}},
+    {"active_group": 3}
+])
+def test_validate_config_rejects_wrong_types(data):
+    with pytest.raises(ValueError):
+        mobiledeck.validate_config(data)
+
+def test_config_version_follows_content():
+    data = config_with_button({"id": "a", "text": "A"})
+    first = mobiledeck.validate_config(data).version
+    assert mobiledeck.validate_config(config_with_button({"id": "a", "text": "A"})).version == first
+    assert mobiledeck.validate_config(config_with_button({"id": "a", "text": "B"})).version != first
+
+def test_compare_and_set():
+    store = mobiledeck.ToggleStateStore()
+    assert store.compare_and_set("a", True, expected=False) == (True, 1)
+    assert store.compare_and_set("a", False, expected=False) == (False, 1)
+    assert store.get("a") is True
+    assert store.compare_and_set("a", True) == (True, 1)
+    assert store.compare_and_set("a", False) == (True, 2)
+
+def test_changes_since():
+    store = mobiledeck.ToggleStateStore(history=2)
+    assert store.changes_since(0) == (0, {})
+    store.compare_and_set("a", True)
+    store.compare_and_set("b", True)
+    store.compare_and_set("a", False)
+    assert store.changes_since(3) == (3, {})
+    assert store.changes_since(1) == (3, {"b": True, "a": False})
+    assert store.changes_since(0) == (3, None)
+    assert store.changes_since(57) == (3, None)
+    assert store.changes_since(-1) == (3, None)
+
+def test_search_index_matches_word_prefixes():
+    index = mobiledeck.SearchIndex()
+    index.add("a", "Mute microphone")
+    index.add("b", "Mute speakers")
+    index.add("c", "Scene 2")
+    assert index.search("") is None
+    assert index.search("mu") == {"a", "b"}
+    assert index.search("mute spe") == {"b"}
+    assert index.search("scene 3") == set()
+    index.add("b", "Volume up")
+    assert index.search("mute") == {"a"}
+    index.retain({"c"})
+    assert index.search("mute") == set()
+    assert index.prefixes.keys() == {"s", "sc", "sce", "scen", "scene", "2"}
+
+class FakeListbox:
+    def __init__(self):
+        self.rows = []
+        self.calls = 0
+
+    def delete(self, first, last):
+        self.calls += 1
+        del self.rows[first:last + 1]
+
+    def insert(self, index, *rows):
+        self.calls += 1
+        self.rows[index:index] = rows
+
+@pytest.mark.parametrize("before, after", [
+    ([], ["a", "b"]),
+    (["a", "b", "c"], ["a", "x", "c"]),
+    (["a", "b", "c"], ["a", "c"]),
+    (["a", "c"], ["a", "b", "c"]),
+    (["a", "b"], []),
+    (["a", "a"], ["a"]),
+    (["a", "b", "c"], ["c", "b", "a"])
+])
+def test_sync_listbox(before, after):
+    manager = SimpleNamespace(listbox_rows={})
+    listbox = FakeListbox()
+    mobiledeck.ButtonManager.sync_listbox(manager, listbox, before)
+    mobiledeck.ButtonManager.sync_listbox(manager, listbox, after)
+    assert listbox.rows == after
+    listbox.calls = 0
+    mobiledeck.ButtonManager.sync_listbox(manager, listbox, after)
+    assert listbox.calls == 0
+
+def test_histogram_buckets():
+    buckets = mobiledeck.LATENCY_BUCKETS
+    for i, bound in enumerate(buckets):
+        histogram = mobiledeck.LatencyHistogram()
+        histogram.observe(bound)
+        histogram.observe(bound * 1.01)
+        counts, total, count = histogram.snapshot()
+        assert counts[i] == 1
+        assert counts[i + 1] == 1
+        assert count == 2
+    histogram = mobiledeck.LatencyHistogram()
+    histogram.observe(0)
+    histogram.observe(1e9)
+    counts, total, count = histogram.snapshot()
+    assert counts[0] == 1 and counts[-1] == 1
+
+def test_run_plan_presses_chords_and_types_text():
+    mobiledeck.set_key_backend('record')
+    plan = mobiledeck.compile_key_plan({"hotkey": ["ctrl", "v"], "sequence": [{"keys": ["enter"], "text": "hi"}]})
+    assert mobiledeck.run_plan(plan, threading.Event())
+    Key = mobiledeck.Key
+    assert list(mobiledeck.keyboard.events) == [
+        ('press', Key.ctrl), ('press', 'v'), ('release', 'v'), ('release', Key.ctrl),
+        ('press', Key.enter), ('release', Key.enter), ('type', 'hi')
+    ]